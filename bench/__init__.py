@@ -0,0 +1 @@
+"""Нагрузочные тесты бота с локальными заменами Telegram Bot API и mcsrvstat.us (см. bench/run.py)"""
@@ -0,0 +1,109 @@
+"""
+Локальная замена API mcsrvstat.us для нагрузочных тестов.
+
+Отвечает на GET /3/<адрес> в формате mcsrvstat.us с заданной задержкой,
+долей ошибок и размером списка игроков.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+
+class FakeStatusApi:
+    """
+    Args:
+        latency (float): средняя задержка ответа, сек.
+        jitter (float): разброс задержки (равномерно ±jitter), сек.
+        error_rate (float): доля ответов 503.
+        offline_rate (float): доля выключенных серверов (зависит только от адреса).
+        players (int): размер players.list в ответе.
+        seed: зерно генератора случайных чисел.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0,
+                 offline_rate: float = 0.0, players: int = 10, host: str = "127.0.0.1", port: int = 0,
+                 seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.offline_rate = offline_rate
+        self.players = players
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-status-api", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/3/"
+
+    def start(self) -> "FakeStatusApi":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def payload(self, address: str) -> dict:
+        """Ответ mcsrvstat.us для адреса"""
+        online = random.Random(address).random() >= self.offline_rate
+        data = {
+            "online": online,
+            "ip": "127.0.0.1",
+            "port": 25565,
+            "hostname": address,
+            "debug": {"ping": True, "query": False, "srv": False},
+        }
+        if online:
+            data.update({
+                "motd": {"clean": [f"Benchmark server {address}", "line 2"]},
+                "version": "1.20.4",
+                "players": {
+                    "online": self.players,
+                    "max": max(100, self.players),
+                    "list": [{"name": f"player{i}", "uuid": f"{i:032x}"} for i in range(self.players)],
+                },
+            })
+        return data
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(delay)
+
+        if not request.path.startswith("/3/"):
+            status, body = 404, b"{}"
+        elif failed:
+            status, body = 503, b'{"error": "unavailable"}'
+        else:
+            status, body = 200, json.dumps(self.payload(unquote(request.path[3:]))).encode("utf-8")
+
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
@@ -0,0 +1,210 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Отдаёт боту синтетические апдейты через getUpdates и записывает ответы
+(sendMessage, answerInlineQuery, ...), сопоставляя их с апдейтами, чтобы
+измерить задержку от появления апдейта до ответа бота.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeTelegramApi:
+    """
+    Args:
+        long_poll (float): сколько getUpdates ждёт новых апдейтов, сек.
+            (меньше настоящего, чтобы бот быстро останавливался).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, long_poll: float = 0.5):
+        self.long_poll = long_poll
+        self.calls: Dict[str, int] = {}
+        self.sent: Dict[int, dict] = {}  # update_id -> {"kind", "sent", "answered", "method", "text"}
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._by_message: Dict[int, int] = {}  # message_id -> update_id
+        self._by_chat: Dict[int, List[int]] = {}  # chat_id -> update_id без ответа
+        self._by_inline: Dict[str, int] = {}  # inline_query_id -> update_id
+        self._lock = threading.Lock()
+        self._new_updates = threading.Condition(self._lock)
+        self._answered = threading.Condition(self._lock)
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api._handle(self)
+
+            def do_POST(self):
+                api._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True)
+
+    @property
+    def api_url(self) -> str:
+        """Шаблон адреса для telebot.apihelper.API_URL"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self) -> "FakeTelegramApi":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --- апдейты ---
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ru"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        """Апдейт с сообщением пользователя (в личном чате)"""
+        message = {
+            "message_id": 0,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"message": message}
+
+    def inline_query(self, user_id: int, query: str) -> dict:
+        """Апдейт с инлайн-запросом"""
+        return {"inline_query": {"id": "", "from": self._user(user_id), "query": query, "offset": ""}}
+
+    def inject(self, updates: List[dict]) -> None:
+        """Добавляет апдейты в очередь getUpdates (необязательный ключ kind - тип апдейта для отчёта)"""
+        now = time.perf_counter()
+        with self._lock:
+            for update in updates:
+                update = json.loads(json.dumps(update))
+                kind = update.pop("kind", None)
+                update_id = update["update_id"] = self._next_update_id
+                self._next_update_id += 1
+                if "message" in update:
+                    message_id = update["message"]["message_id"] = self._next_message_id
+                    self._next_message_id += 1
+                    self._by_message[message_id] = update_id
+                    self._by_chat.setdefault(update["message"]["chat"]["id"], []).append(update_id)
+                    kind = kind or (update["message"]["text"].split()[0] if update["message"]["text"].startswith("/")
+                                    else "text")
+                else:
+                    inline_id = update["inline_query"]["id"] = str(update_id)
+                    self._by_inline[inline_id] = update_id
+                    kind = kind or "inline"
+                self.sent[update_id] = {"kind": kind, "sent": now, "answered": None, "method": None}
+                self._updates.append(update)
+            self._new_updates.notify_all()
+
+    def wait_answered(self, timeout: float) -> bool:
+        """Ждёт ответа на все апдейты; False, если время вышло"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while any(item["answered"] is None for item in self.sent.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._answered.wait(remaining)
+        return True
+
+    # --- HTTP ---
+
+    @staticmethod
+    def _params(request: BaseHTTPRequestHandler) -> dict:
+        params = dict(parse_qsl(urlsplit(request.path).query))
+        length = int(request.headers.get("Content-Length") or 0)
+        if length:
+            body = request.rfile.read(length).decode("utf-8", "replace")
+            if request.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body or "{}"))
+            else:
+                params.update(parse_qsl(body))
+        return params
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        method = urlsplit(request.path).path.rsplit("/", 1)[-1]
+        params = self._params(request)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        handler = getattr(self, f"_api_{method}", None)
+        result = handler(params) if handler is not None else True
+
+        body = json.dumps({"ok": True, "result": result}).encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def _api_getMe(self, params: dict):
+        return BOT_USER
+
+    def _api_getUpdates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = min(float(params.get("timeout") or 0), self.long_poll)
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._new_updates.wait(remaining)
+            return self._updates[:limit]
+
+    def _record(self, update_id: Optional[int], method: str, text: str = "") -> None:
+        if update_id is None or update_id not in self.sent:
+            return
+        item = self.sent[update_id]
+        if item["answered"] is None:
+            item.update(answered=time.perf_counter(), method=method, text=text)
+            self._answered.notify_all()
+
+    def _api_sendMessage(self, params: dict):
+        chat_id = int(params.get("chat_id", 0))
+        reply_to = params.get("reply_to_message_id")
+        if reply_to is None and params.get("reply_parameters"):
+            reply_to = json.loads(params["reply_parameters"]).get("message_id")
+        with self._lock:
+            update_id = self._by_message.get(int(reply_to)) if reply_to is not None else None
+            pending = self._by_chat.get(chat_id, [])
+            if update_id is None:
+                update_id = next((u for u in pending if self.sent[u]["answered"] is None), None)
+            if update_id in pending:
+                pending.remove(update_id)
+            self._record(update_id, "sendMessage", params.get("text", ""))
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def _api_answerInlineQuery(self, params: dict):
+        with self._lock:
+            self._record(self._by_inline.get(params.get("inline_query_id")), "answerInlineQuery",
+                         params.get("results", ""))
+        return True
@@ -0,0 +1,264 @@
+"""
+Нагрузочный тест бота без Telegram и mcsrvstat.us.
+
+Запускает Bot (или AsyncBot) с локальными FakeTelegramApi и FakeStatusApi,
+подаёт синтетические апдейты и выводит пропускную способность, задержки
+(p50/p95/p99) и количество коммитов в базу.
+
+Пример:
+    python -m bench.run --scenario mixed --updates 2000 --api-latency 0.1 --output result.json
+    python -m bench.run --scenario mixed --updates 2000 --api-latency 0.1 --baseline result.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_status_api import FakeStatusApi  # noqa: E402
+from bench.fake_telegram import FakeTelegramApi  # noqa: E402
+
+SCENARIOS = ("stats", "address", "fav", "inline", "mixed")
+MIXED_WEIGHTS = {"stats": 0.4, "address": 0.3, "fav": 0.15, "inline": 0.15}
+FAV_PER_USER = 3
+INLINE_USER_BASE = 10 ** 9  # у каждого инлайн-запроса свой пользователь, чтобы debounce не отбрасывал запросы
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def server_address(rng: random.Random, servers: int) -> str:
+    # популярность серверов убывает как 1/k: часть запросов попадает в кэш
+    k = rng.choices(range(servers), weights=[1 / (i + 1) for i in range(servers)])[0]
+    return f"server{k}.bench"
+
+
+def build_updates(telegram: FakeTelegramApi, scenario: str, count: int, users: int, servers: int,
+                  rng: random.Random) -> List[dict]:
+    updates = []
+    for i in range(count):
+        kind = scenario
+        if scenario == "mixed":
+            kind = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+        user_id = rng.randint(1, users)
+        if kind == "stats":
+            update = telegram.message(user_id, f"/stats {server_address(rng, servers)}")
+        elif kind == "address":
+            update = telegram.message(user_id, server_address(rng, servers))
+        elif kind == "fav":
+            update = telegram.message(user_id, f"fav{rng.randrange(FAV_PER_USER)}")
+        else:
+            update = telegram.inline_query(INLINE_USER_BASE + i, server_address(rng, servers))
+        update["kind"] = kind
+        updates.append(update)
+    return updates
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальными заменами Telegram и API")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--mode", choices=("polling", "async"), default="polling")
+    parser.add_argument("--updates", type=int, default=1000, help="количество апдейтов")
+    parser.add_argument("--rate", type=float, default=0, help="апдейтов в секунду (0 - все сразу)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--servers", type=int, default=50, help="количество разных адресов серверов")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="задержка API серверов, сек.")
+    parser.add_argument("--api-jitter", type=float, default=0.0)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--offline-rate", type=float, default=0.0, help="доля выключенных серверов")
+    parser.add_argument("--players", type=int, default=10, help="размер списка игроков в ответе API")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="оставить ограничения частоты запросов бота (по умолчанию выключены)")
+    parser.add_argument("--threads", type=int, default=None, help="BOT_THREADS для режима polling")
+    parser.add_argument("--timeout", type=float, default=120, help="сколько ждать ответов, сек.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON с результатом для сравнения")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir: str) -> None:
+    """Переменные окружения для main.py (читаются при импорте)"""
+    os.environ.update({
+        "BOT_TOKEN": "1:bench",
+        "DB_PATH": f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}",
+        "PREFETCH_ENABLED": "0",
+        "METRICS_PORT": "0",
+        "LOG_CONSOLE": "0",
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+    if not args.rate_limits:
+        # синтетические пользователи шлют запросы чаще настоящих: отказы по лимитам
+        # дают мгновенные ответы и завышают пропускную способность
+        os.environ.update({"USER_RATE_LIMIT": "0", "CHAT_RATE_LIMIT": "0"})
+    if args.threads is not None:
+        os.environ["BOT_THREADS"] = str(args.threads)
+    os.chdir(workdir)  # app.log и msgs.txt пишутся во временный каталог
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="mcbot-bench-")
+    configure_environment(args, workdir)
+
+    import main
+    import models.minecraft_server_info as server_info
+    from models.metrics import rate_limited
+    from sqlalchemy import event
+    from telebot import apihelper, asyncio_helper
+
+    status_api = FakeStatusApi(latency=args.api_latency, jitter=args.api_jitter, error_rate=args.api_error_rate,
+                               offline_rate=args.offline_rate, players=args.players, seed=args.seed).start()
+    telegram = FakeTelegramApi().start()
+    server_info.STATUS_API_URL = status_api.url
+    apihelper.API_URL = telegram.api_url
+    asyncio_helper.API_URL = telegram.api_url
+
+    bot = main.AsyncBot() if args.mode == "async" else main.Bot()
+    session = bot.session.sync if args.mode == "async" else bot.session
+
+    # у каждого пользователя есть избранные сервера для сценария fav
+    rng = random.Random(args.seed)
+    for user_id in range(1, args.users + 1):
+        session.add_user(main.User(id=user_id))
+        session.set_fav_servers(user_id, {f"fav{i}": server_address(rng, args.servers) for i in range(FAV_PER_USER)})
+    session.user_cache.clear()
+
+    db = {"commits": 0, "statements": 0}
+    event.listen(session.engine, "commit", lambda conn: db.__setitem__("commits", db["commits"] + 1))
+    event.listen(session.engine, "after_cursor_execute",
+                 lambda *a: db.__setitem__("statements", db["statements"] + 1))
+
+    thread = threading.Thread(target=bot.mainloop, name="bench-bot", daemon=True)
+    thread.start()
+    while not telegram.calls.get("getUpdates"):
+        time.sleep(0.01)
+
+    updates = build_updates(telegram, args.scenario, args.updates, args.users, args.servers, rng)
+    started = time.perf_counter()
+    if args.rate > 0:
+        for i, update in enumerate(updates):
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            telegram.inject([update])
+    else:
+        telegram.inject(updates)
+    completed = telegram.wait_answered(args.timeout)
+
+    answered = [item for item in telegram.sent.values() if item["answered"] is not None]
+    finished = max((item["answered"] for item in answered), default=time.perf_counter())
+    elapsed = finished - started
+
+    if args.mode == "async":
+        bot.bot._polling = False
+    else:
+        bot.bot.stop_polling()
+    thread.join(timeout=10)  # после остановки записываются накопленные счётчики запросов
+    status_api.stop()
+    telegram.stop()
+
+    by_kind: Dict[str, List[float]] = {}
+    for item in answered:
+        by_kind.setdefault(item["kind"], []).append(item["answered"] - item["sent"])
+
+    return {
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "completed": completed,
+        "updates": len(updates),
+        "answered": len(answered),
+        "rate_limited": int(rate_limited.value(scope="user") + rate_limited.value(scope="chat")),
+        "elapsed": elapsed,
+        "throughput": len(answered) / elapsed if elapsed > 0 else 0.0,
+        "latency": latency_summary([latency for values in by_kind.values() for latency in values]),
+        "latency_by_kind": {kind: latency_summary(values) for kind, values in sorted(by_kind.items())},
+        "db_commits": db["commits"],
+        "db_statements": db["statements"],
+        "upstream_requests": status_api.requests,
+        "upstream_errors": status_api.errors,
+        "lookup_cache": server_info.lookup_cache.stats(),
+        "telegram_calls": dict(telegram.calls),
+    }
+
+
+def _get(data: dict, key: str):
+    for part in key.split("."):
+        data = data.get(part) if isinstance(data, dict) else None
+    return data
+
+
+def format_report(result: dict, baseline: dict = None) -> str:
+    rows = [
+        ("Пропускная способность", "throughput", "{:.1f}/s", 1, True),
+        ("Задержка p50", "latency.p50", "{:.1f} ms", 1000, False),
+        ("Задержка p95", "latency.p95", "{:.1f} ms", 1000, False),
+        ("Задержка p99", "latency.p99", "{:.1f} ms", 1000, False),
+        ("Коммитов в базу", "db_commits", "{:.0f}", 1, False),
+        ("SQL-запросов", "db_statements", "{:.0f}", 1, False),
+        ("Запросов к API", "upstream_requests", "{:.0f}", 1, False),
+    ]
+    lines = [f"Сценарий: {result['args']['scenario']}, режим: {result['args']['mode']}, "
+             f"апдейтов: {result['updates']}, отвечено: {result['answered']}"]
+    if result.get("rate_limited"):
+        lines.append(f"⚠️ Отказов по ограничению частоты запросов: {result['rate_limited']} "
+                     f"(входят в пропускную способность и задержки)")
+    for name, key, fmt, scale, higher_is_better in rows:
+        value = _get(result, key) * scale
+        text = f"{name:<24}{fmt.format(value):>12}"
+        old = _get(baseline, key) if baseline is not None else None
+        if old:
+            old *= scale
+            change = (value - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            text += f"   было {fmt.format(old):>12}  {change:+.1f}%{' ✓' if better else ''}"
+        lines.append(text)
+
+    lines.append("По типам апдейтов:")
+    for kind, summary in result["latency_by_kind"].items():
+        lines.append(f"  {kind:<10} n={summary['count']:<6} p50={summary['p50'] * 1000:.1f} ms  "
+                     f"p95={summary['p95'] * 1000:.1f} ms  p99={summary['p99'] * 1000:.1f} ms")
+    if not result["completed"]:
+        lines.append(f"⚠️ Не все апдейты получили ответ за {result['args']['timeout']:g} с")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    result = run(args)
+    print(format_report(result, baseline))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if result["completed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,35 @@
 import html
+import math
+import re
+import secrets
 
 import requests               # Библиотека для HTTP-запросов
 import telebot               # Основная библиотека для работы с Telegram API
 from telebot import formatting as frmt  # Модуль форматирования сообщений
 import models                 # Пакет моделей, содержащий бизнес-логику приложения
-from models.minecraft_server_info import get_mc_server_info, GetServerInfoError  # Функции для получения информации о серверах Minecraft
+from models.cache import RenderCache, SharedLookupStore
+from models.minecraft_server_info import (  # Функции для получения информации о серверах Minecraft
+    get_mc_server_info, GetServerInfoError, lookup_cache, set_lookup_backend, configure_http_client,
+    async_get_mc_server_info, get_async_http_client, peek_mc_server_info, refresh_mc_server_info,
+    prefetch_mc_server_info, normalize_address, request_frequency, configure_upstream_limit, add_lookup_listener,
+)
+from models.prefetch import PrefetchScheduler
+from models.log_setup import setup_logging
+from models.metrics import MetricsServer, gauge, handler_seconds, rate_limited, render_seconds, telegram_seconds
+from models.ratelimit import KeyedRateLimiter
+from telebot import apihelper, asyncio_helper
 from random import randint     # Используется для генерации случайных чисел
 import time                   # Работа с датой и временем
-from models.orm import MySession, User  # ORM-модели для работы с базой данных
+from models.orm import MySession, AsyncMySession, User, create_schema  # ORM-модели для работы с базой данных
 import logging                # Стандартная библиотека Python для ведения логов
 import os
 from dotenv import load_dotenv
 import threading
-from flask import Flask
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+from models.webhook import WebhookServer
+from models.workers import WorkerPool, serve_partition
+from telebot.async_telebot import AsyncTeleBot
 
 # Загружаем переменные из .env
 load_dotenv()
@@ -23,22 +40,127 @@ TOKEN = os.getenv("BOT_TOKEN")
 if not TOKEN:
     raise ValueError("Токен бота не найден в .env!")
 
-# настройка логгера
-logger = logging.getLogger('my_app')
-logger.setLevel(logging.DEBUG)
+# база данных: путь к SQLite или URL серверной базы (postgresql://..., mysql://...)
+DB_PATH = os.getenv("DB_PATH", "sqlite:///data.sqlite")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+# кэш пользователей и их избранных серверов
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 600))
+# отложенная запись счётчиков запросов
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 5))
+DB_FLUSH_THRESHOLD = int(os.getenv("DB_FLUSH_THRESHOLD", 100))
+# история состояния серверов (/history): интервал между замерами одного сервера, сек.,
+# и сколько дней хранятся замеры, часовые и суточные агрегаты
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+HISTORY_INTERVAL = float(os.getenv("HISTORY_INTERVAL", 60))
+HISTORY_RAW_DAYS = float(os.getenv("HISTORY_RAW_DAYS", 2))
+HISTORY_HOURLY_DAYS = float(os.getenv("HISTORY_HOURLY_DAYS", 30))
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", 365))
+
+# количество потоков, обрабатывающих апдейты в режиме polling
+BOT_THREADS = int(os.getenv("BOT_THREADS", 2))
+
+# режим работы: polling (потоки), async (asyncio), webhook (Flask) или workers (несколько процессов)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# режим workers: количество рабочих процессов и длина очереди апдейтов каждого из них
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 2))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 1000))
+WORKER_ID = os.getenv("WORKER_ID")  # номер рабочего процесса, задаётся при запуске процесса
+
+# проверка всех избранных серверов (/fav status): общий таймаут и число параллельных запросов
+FAV_STATUS_TIMEOUT = float(os.getenv("FAV_STATUS_TIMEOUT", 10))
+FAV_STATUS_WORKERS = int(os.getenv("FAV_STATUS_WORKERS", 16))
+# в инлайн-режиме ответ нужен быстрее: Telegram ждёт его всего несколько секунд
+INLINE_FAV_TIMEOUT = float(os.getenv("INLINE_FAV_TIMEOUT", 3))
+# задержка перед запросом в инлайн-режиме: пока пользователь печатает, запросы не отправляются
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", 0.4))
+INLINE_WORKERS = int(os.getenv("INLINE_WORKERS", 8))  # потоки для отложенных инлайн-запросов (режим с потоками)
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# логгер для фаилов
-file_handler = logging.FileHandler('app.log')
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-# логгер для консоли
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(formatter)
+# ограничение частоты запросов к серверам: запросов в минуту и сколько можно сделать подряд (0 - без ограничения)
+USER_RATE_LIMIT = float(os.getenv("USER_RATE_LIMIT", 30))
+USER_RATE_BURST = float(os.getenv("USER_RATE_BURST", 10))
+CHAT_RATE_LIMIT = float(os.getenv("CHAT_RATE_LIMIT", 60))  # для групповых чатов
+CHAT_RATE_BURST = float(os.getenv("CHAT_RATE_BURST", 20))
+UPSTREAM_MAX_CONCURRENT = int(os.getenv("UPSTREAM_MAX_CONCURRENT", 32))
+# в режиме workers пользователь всегда попадает в один процесс, поэтому его лимит не меняется;
+# участники группового чата и запросы к серверам распределены по всем процессам, поэтому
+# лимиты чата и число одновременных запросов делятся между процессами (приблизительно)
+if WORKER_ID is not None and WORKER_PROCESSES > 1:
+    CHAT_RATE_LIMIT /= WORKER_PROCESSES
+    CHAT_RATE_BURST = max(1.0, CHAT_RATE_BURST / WORKER_PROCESSES)
+    if UPSTREAM_MAX_CONCURRENT > 0:
+        UPSTREAM_MAX_CONCURRENT = max(1, math.ceil(UPSTREAM_MAX_CONCURRENT / WORKER_PROCESSES))
+# одновременные запросы к серверам и API; остальные ждут в очереди не дольше UPSTREAM_QUEUE_TIMEOUT секунд
+configure_upstream_limit(
+    max_concurrent=UPSTREAM_MAX_CONCURRENT,
+    queue_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 10)),
+)
 
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# настройка кэша запросов к серверам
+lookup_cache.configure(
+    max_size=int(os.getenv("CACHE_MAX_SIZE", 1024)),
+    ttl=float(os.getenv("CACHE_TTL", 60)),
+    negative_ttl=float(os.getenv("CACHE_NEGATIVE_TTL", 15)),
+)
+# общий для процессов кэш запросов к серверам (SQLite); в режиме workers включён по умолчанию
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "lookup_cache.sqlite" if BOT_MODE == "workers" else "")
+if SHARED_CACHE_PATH:
+    lookup_cache.configure(shared=SharedLookupStore(SHARED_CACHE_PATH))
+# сформированные описания серверов (по одному на снимок данных в кэше запросов)
+render_cache = RenderCache(max_size=int(os.getenv("RENDER_CACHE_SIZE", 1024)))
+# пул соединений к API mcsrvstat.us
+configure_http_client(
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", 32)),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05)),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", 15)),
+    retries=int(os.getenv("HTTP_RETRIES", 2)),
+)
+# фоновое обновление популярных серверов
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_BUDGET = float(os.getenv("PREFETCH_BUDGET", 60))
+PREFETCH_MAX_SERVERS = int(os.getenv("PREFETCH_MAX_SERVERS", 100))
+# по умолчанию обновляем данные незадолго до того, как они устареют в кэше
+PREFETCH_MIN_INTERVAL = float(os.getenv("PREFETCH_MIN_INTERVAL", lookup_cache.ttl * 0.8))
+PREFETCH_MAX_INTERVAL = float(os.getenv("PREFETCH_MAX_INTERVAL", 600))
+
+# приём апдейтов через webhook (BOT_MODE=webhook)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, например https://example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 8))
+# кэш пользователей у каждого экземпляра свой: за балансировщиком другой экземпляр
+# может показывать устаревшее избранное, поэтому в режиме webhook кэш живёт недолго
+WEBHOOK_USER_CACHE_TTL = float(os.getenv("WEBHOOK_USER_CACHE_TTL", 5))
+
+# метрики Prometheus: порт HTTP-сервера с /metrics (0 - выключено); в режиме webhook /metrics есть и на порту webhook
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# способ получения информации о серверах: api (mcsrvstat.us), slp (напрямую) или несколько через запятую
+set_lookup_backend(
+    os.getenv("LOOKUP_BACKEND", "api"),
+    percentile=float(os.getenv("HEDGE_PERCENTILE", 0.95)),
+    min_delay=float(os.getenv("HEDGE_MIN_DELAY", 0.1)),
+    max_delay=float(os.getenv("HEDGE_MAX_DELAY", 3)),
+)
+
+# настройка логгера: запись в файлы выполняется фоновым потоком;
+# у каждого рабочего процесса свои файлы, чтобы процессы не ротировали один и тот же файл
+LOG_SUFFIX = f".worker{WORKER_ID}" if WORKER_ID is not None else ""
+setup_logging(
+    log_file=f"app{LOG_SUFFIX}.log",
+    msgs_file=f"msgs{LOG_SUFFIX}.txt",
+    json_format=os.getenv("LOG_FORMAT", "text") == "json",
+    console=os.getenv("LOG_CONSOLE", "1") == "1",
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+    backup_count=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+    rotate_interval=float(os.getenv("LOG_ROTATE_INTERVAL", 24 * 60 * 60)),
+)
+logger = logging.getLogger('my_app')
+msg_logger = logging.getLogger('my_app.msgs')
 
 
 def print_fav_servers(fav_servers: dict):
@@ -73,12 +195,104 @@ def get_printable_time():
     return time.strftime("%H:%M.%S %d.%m.%Y", time.localtime())  # упорядочиваем время в нужный формат
 
 
-# запись текста в файл
+# запись текста в файл (msgs.txt) и в консоль
 def write_msg(msg):
-    with open("msgs.txt", "a+", encoding="utf-8") as f:
-        text = f"[{get_printable_time()}] {msg}\n"
-        f.write(text)
-        print(text, end="")
+    msg_logger.info(msg)
+
+
+def create_session() -> MySession:
+    session = MySession(DB_PATH, pool_size=DB_POOL_SIZE,
+                        cache_size=USER_CACHE_SIZE, cache_ttl=USER_CACHE_TTL,
+                        flush_interval=DB_FLUSH_INTERVAL, flush_threshold=DB_FLUSH_THRESHOLD,
+                        history_interval=HISTORY_INTERVAL,
+                        history_retention=(HISTORY_RAW_DAYS, HISTORY_HOURLY_DAYS, HISTORY_RETENTION_DAYS),
+                        # историю, как и популярные сервера, обслуживает только рабочий процесс 0
+                        history_compact_interval=0 if WORKER_ID not in (None, "0") else 600,
+                        # в режиме workers таблицы создаёт и переносит данные процесс-распределитель (create_schema)
+                        init_schema=WORKER_ID is None)
+    if HISTORY_ENABLED:
+        # каждый ответ сервера (в том числе фоновые обновления) сохраняется в историю
+        add_lookup_listener(session.record_server_status)
+    return session
+
+
+def start_prefetch(session: MySession):
+    """Запускает фоновое обновление популярных и избранных серверов"""
+    if not PREFETCH_ENABLED:
+        return None
+
+    def fav_source(limit):
+        return [(normalize_address(address), count) for address, count in session.get_top_fav_addresses(limit)]
+
+    return PrefetchScheduler(prefetch_mc_server_info, request_frequency, fav_source,
+                             budget_per_minute=PREFETCH_BUDGET, max_servers=PREFETCH_MAX_SERVERS,
+                             min_interval=PREFETCH_MIN_INTERVAL, max_interval=PREFETCH_MAX_INTERVAL).start()
+
+
+def _timed_telegram_request(method, url, **kwargs):
+    with telegram_seconds.time(method=url.rsplit("/", 1)[-1], result="error") as timer:
+        response = apihelper._get_req_session().request(method, url, **kwargs)
+        timer.labels["result"] = "ok" if response.status_code == 200 else "error"
+    return response
+
+
+def _timed_async_telegram_request(process_request):
+    async def wrapper(token, url, *args, **kwargs):
+        with telegram_seconds.time(method=url, result="error") as timer:
+            result = await process_request(token, url, *args, **kwargs)
+            timer.labels["result"] = "ok"
+        return result
+    return wrapper
+
+
+def instrument_telegram_api():
+    """Замер времени запросов к Telegram Bot API (TeleBot и AsyncTeleBot)"""
+    if apihelper.CUSTOM_REQUEST_SENDER is None:
+        apihelper.CUSTOM_REQUEST_SENDER = _timed_telegram_request
+    if not getattr(asyncio_helper._process_request, "timed", False):
+        asyncio_helper._process_request = _timed_async_telegram_request(asyncio_helper._process_request)
+        asyncio_helper._process_request.timed = True
+
+
+def register_metrics(session: MySession, bot=None, webhook_server: WebhookServer = None):
+    """Метрики кэшей и очередей, которые вычисляются при каждом чтении /metrics"""
+    caches = {"lookup": lookup_cache, "user": session.user_cache, "render": render_cache}
+
+    def cache_ratio():
+        ratios = {}
+        for name, cache in caches.items():
+            stats = cache.stats()
+            total = stats["hits"] + stats["misses"]
+            ratios[name] = stats["hits"] / total if total else 0.0
+        return ratios
+
+    def queues():
+        depths = {"db_pending_requests": session.pending_requests(),
+                  "upstream": models.minecraft_server_info.upstream_limiter.queued()}
+        if bot is not None and bot.prefetch is not None:
+            depths["prefetch"] = bot.prefetch.queue_size()
+        if webhook_server is not None:
+            depths["webhook"] = webhook_server.queue.qsize()
+        return depths
+
+    gauge("mcbot_cache_lookups", "Обращения к кэшу", ["cache", "result"],
+          lambda: {(name, result): cache.stats()[key]
+                   for name, cache in caches.items() for result, key in (("hit", "hits"), ("miss", "misses"))})
+    gauge("mcbot_cache_hit_ratio", "Доля попаданий в кэш", ["cache"], cache_ratio)
+    gauge("mcbot_cache_size", "Количество записей в кэше", ["cache"],
+          lambda: {name: len(cache) for name, cache in caches.items()})
+    gauge("mcbot_lookup_shared", "Запросы к серверам, объединённые с уже выполняющимися",
+          fn=lambda: models.minecraft_server_info.lookup_flight.shared)
+    gauge("mcbot_queue_depth", "Длина очередей", ["queue"], queues)
+    gauge("mcbot_upstream_active", "Выполняющиеся запросы к серверам",
+          fn=lambda: models.minecraft_server_info.upstream_limiter.active)
+
+
+def start_metrics_server(port_offset: int = 0):
+    """port_offset - сдвиг порта для рабочих процессов режима workers"""
+    if not METRICS_PORT:
+        return None
+    return MetricsServer(METRICS_HOST, METRICS_PORT + port_offset).start()
 
 
 def on_msg(msg):
@@ -102,46 +316,346 @@ class Bot():
     • <code>/fav add 2b2t.org</code> - добавить сервер с адресом 2b2t.org в избранные сервера (имя в избранных совпадает с адресом)
     • <code>/fav add 2b2t.org bestServer</code> - добавить сервер с адресом 2b2t.org в избранные под именем bestServer
     • <code>/fav del 2b2t.org</code> - удаляет сервер с именем 2b2t.org из избранного
+    • /fav status - проверить сразу все избранные сервера (в инлайн-режиме: <code>@бот fav</code>)
+• <code>/history ADDRESS</code> - онлайн сервера за последние сутки (<code>/history ADDRESS 7d</code> - за неделю)
     """)
     INVILID_CMD_USE = "Неверное использование команды\nДля получения справки: /help"
+    HISTORY_POINTS = 24  # столбцов в графике /history
+    SPARK_CHARS = "▁▂▃▄▅▆▇█"
+    MAX_MESSAGE_LENGTH = 4096  # ограничение Telegram на длину сообщения
+    MAX_FIELD_LENGTH = 100  # версия и адреса приходят от сервера и могут быть любой длины
+
+    def __init__(self, threaded: bool = True):
+        # в режиме webhook апдейты обрабатывают потоки WebhookServer, собственный пул TeleBot не нужен
+        self.bot = telebot.TeleBot(TOKEN, threaded=threaded, num_threads=BOT_THREADS)
+        self.session = create_session()
+        # пул для параллельной проверки избранных серверов
+        self.fav_status_executor = ThreadPoolExecutor(max_workers=FAV_STATUS_WORKERS, thread_name_prefix="fav-status")
+        # пул для отложенных инлайн-запросов: потоки обработчиков не ждут INLINE_DEBOUNCE
+        self.inline_executor = ThreadPoolExecutor(max_workers=INLINE_WORKERS, thread_name_prefix="inline")
+        self._init_inline_state()
+        self._init_rate_limits()
+        self.prefetch = None
+        instrument_telegram_api()
+
+    def _init_inline_state(self):
+        # последний инлайн-запрос каждого пользователя (для подавления промежуточного ввода)
+        self._inline_latest = {}
+        self._inline_seq = 0
+        self._inline_timers = {}  # отложенные запросы пользователей (режим с потоками)
+        self._inline_lock = threading.Lock()
+
+    def _init_rate_limits(self):
+        self.user_limiter = KeyedRateLimiter(USER_RATE_LIMIT / 60, USER_RATE_BURST)
+        self.chat_limiter = KeyedRateLimiter(CHAT_RATE_LIMIT / 60, CHAT_RATE_BURST)
 
-    def __init__(self):
-        self.bot = telebot.TeleBot(TOKEN)
-        self.session = MySession()
+    def rate_limit_wait(self, user_id, chat_id=None, cost=1) -> float:
+        """
+        Проверяет ограничения частоты запросов пользователя и группового чата.
+        0 - запрос разрешён (токены списаны), иначе через сколько секунд можно повторить.
+        """
+        if chat_id == user_id:
+            chat_id = None  # личный чат ограничивается лимитом пользователя
+        # проверка и списание в обоих вёдрах - одна операция, иначе параллельный запрос мог бы пройти бесплатно
+        user_wait, *chat_wait = self.user_limiter.take_with(
+            user_id, cost, [(self.chat_limiter, chat_id)] if chat_id is not None else [])
+        chat_wait = chat_wait[0] if chat_wait else 0.0
+        if user_wait > 0 or chat_wait > 0:
+            rate_limited.inc(scope="user" if user_wait >= chat_wait else "chat")
+            return max(user_wait, chat_wait)
+        return 0.0
+
+    @staticmethod
+    def rate_limit_text(wait_time: float) -> str:
+        return f"Слишком много запросов, попробуйте через {max(1, math.ceil(wait_time))} с"
+
+    def inline_rate_limit_item(self, query, user_id, cost=1):
+        """Результат инлайн-запроса с ошибкой, если превышено ограничение частоты запросов, иначе None"""
+        wait_time = self.rate_limit_wait(user_id, cost=cost)
+        if wait_time:
+            return self.inline_server_item(query, error=GetServerInfoError(self.rate_limit_text(wait_time)))
+        return None
 
     def generate_server_description(self, address: str) -> str:
         """Описание сервера"""
         try:
             data = get_mc_server_info(address)  # попытка пингануть данные сервера по данному (address)
-            if data["ping"]:
-                if len(data['players_list']) > 0:
-                    pl_list = f"\n• Список игроков: {(', '.join(frmt.hcode(p['name']) for p in data['players_list']) if data['players_list'] else '-')}"
-                else:
-                    pl_list = ""
+        except requests.exceptions.Timeout:
+            raise GetServerInfoError(
+                f'Превышено время ожидания ответа от сервера {address}')  # если произошёл таймаут
+
+        except ConnectionError:
+            raise GetServerInfoError("Ошибка подключения!") # нету интернета
+
+        return self.render_server_description(address, data)
+
+    def render_server_description(self, address: str, data: dict) -> str:
+        """
+        Формирует текст описания сервера по полученным данным.
+        Текст кэшируется для каждого снимка данных, поэтому ответы в чат, кнопки
+        избранного и инлайн-режим с одними и теми же данными формируют его один раз.
+        """
+        text = render_cache.get(address, data)
+        if text is None:
+            text = render_cache.set(address, data, self._render_server_description(address, data))
+        return text
 
+    @classmethod
+    def shorten(cls, text, limit: int = None) -> str:
+        """Обрезает строку до limit символов (по умолчанию MAX_FIELD_LENGTH), добавляя «…»"""
+        text, limit = str(text), limit or cls.MAX_FIELD_LENGTH
+        return text if len(text) <= limit else text[:limit - 1] + "…"
+
+    @render_seconds.time()
+    def _render_server_description(self, address: str, data: dict) -> str:
+        try:
+            if data["ping"]:
                 motd_text = '\n'.join(data['motd'])
-                return f"""{'🟢' if data['is_online'] else "⚫"} {frmt.hbold('Сервер')} {frmt.hcode(address)} 
+                # с такими полями сообщение без описания и игроков заведомо короче MAX_MESSAGE_LENGTH
+                address = frmt.hcode(self.shorten(address))
+                ip = frmt.hcode(self.shorten(data['address']))
+                version = frmt.hcode(self.shorten(data['version']))
 
-• Запрос: {frmt.hcode(address)}
-• Цифровой IP: {frmt.hcode(data['address'])}
+                def render(motd_text, pl_list):
+                    return f"""{'🟢' if data['is_online'] else "⚫"} {frmt.hbold('Сервер')} {address} 
+
+• Запрос: {address}
+• Цифровой IP: {ip}
 • Описание: 
 {frmt.hpre(motd_text, language="motd")}
-• Версия: {frmt.hcode(data['version'])}
+• Версия: {version}
 • Онлайн игроков: {data['players']} / {data['max_players']}{pl_list} 
 """
+
+                text = render(motd_text, "")
+                if len(text) > self.MAX_MESSAGE_LENGTH:
+                    # после экранирования символ может занимать до 5 символов (&amp;), поэтому
+                    # самую длинную помещающуюся часть описания ищем двоичным поиском
+                    low, high = 0, len(motd_text)
+                    while low < high:
+                        middle = (low + high + 1) // 2
+                        if len(render(motd_text[:middle] + "…", "")) <= self.MAX_MESSAGE_LENGTH:
+                            low = middle
+                        else:
+                            high = middle - 1
+                    motd_text = motd_text[:low] + "…"
+                    text = render(motd_text, "")
+                pl_list = self.format_players_list(data['players_list'], self.MAX_MESSAGE_LENGTH - len(text))
+                return render(motd_text, pl_list) if pl_list else text
             else:
                 raise GetServerInfoError(f'Произошла ошибка. Нет ответа от сервера {address}')  # если пинг провалился
 
-        except requests.exceptions.Timeout:
-            raise GetServerInfoError(
-                f'Превышено время ожидания ответа от сервера {address}')  # если произошёл таймаут
-
         except KeyError as e:
             telebot.logger.error("Missing key in data: %s", str(e))
             return frmt.hbold("⚠️ Ошибка формирования данных") # неправильно указанны данные
 
+    @staticmethod
+    def format_players_list(players: list, budget: int) -> str:
+        """
+        Строка со списком игроков длиной не больше budget символов.
+        Не поместившиеся игроки заменяются на «… и ещё N»; имена экранируются
+        только для тех игроков, которые попадут в сообщение.
+        """
+        if not players:
+            return ""
+        prefix = "\n• Список игроков: "
+        reserve = len(f", … и ещё {len(players)}")
+        names = []
+        length = len(prefix)
+        for player in players:
+            name = frmt.hcode(player['name'])
+            if length + len(name) + 2 > budget - reserve:
+                break
+            names.append(name)
+            length += len(name) + 2
+        else:
+            return prefix + ", ".join(names)
+
+        more = f"… и ещё {len(players) - len(names)}"
+        if not names:
+            return prefix + more if len(prefix) + len(more) <= budget else ""
+        return prefix + ", ".join(names) + ", " + more
+
+    def format_fav_status(self, fav_servers: list, results: dict, timeout: float = FAV_STATUS_TIMEOUT) -> str:
+        """
+        Сводка по избранным серверам.
+
+        results: имя -> данные сервера или исключение; отсутствие имени означает,
+        что сервер не ответил за timeout секунд.
+        """
+        if not fav_servers:
+            return "У вас нет избранных серверов\nДобавить: <code>/fav add 2b2t.org</code>"
+
+        lines = []
+        for name, address in fav_servers:
+            result = results.get(name)
+            if result is None:
+                lines.append(f"⏳ {frmt.hcode(name)} - нет ответа за {timeout:g} с")
+            elif isinstance(result, Exception):
+                lines.append(f"🔴 {frmt.hcode(name)} - ошибка: {html.escape(str(result))}")
+            elif result["ping"] and result["is_online"]:
+                lines.append(f"🟢 {frmt.hcode(name)} - {result['players']} / {result['max_players']}, "
+                             f"{frmt.hcode(str(result['version']))}")
+            else:
+                lines.append(f"⚫ {frmt.hcode(name)} - выключен")
+        return frmt.hbold("Статус избранных серверов:") + "\n" + "\n".join(lines)
+
+    @staticmethod
+    def parse_history_period(text: str):
+        """Период истории из аргумента команды (24h, 7d, ...) в секундах; None, если не распознан"""
+        match = re.fullmatch(r"(\d+)\s*([hdчд])", text.strip().lower())
+        if not match:
+            return None
+        seconds = int(match.group(1)) * (3600 if match.group(2) in "hч" else 86400)
+        return min(seconds, int(HISTORY_RETENTION_DAYS * 86400)) or None
+
+    def render_history(self, address: str, rows: list, period: int, now: float = None) -> str:
+        """
+        Тренд онлайна сервера: график из HISTORY_POINTS столбцов и сводка.
+        rows - результат MySession.get_server_history.
+        """
+        hours = period // 3600
+        period_text = f"{hours} ч" if hours < 48 else f"{hours // 24} дн"
+        title = f"📈 {frmt.hbold('История сервера')} {frmt.hcode(address)} за {period_text}"
+        if not rows:
+            return f"{title}\n\nНет данных. История собирается, когда сервер кто-нибудь запрашивает."
+
+        now = now if now is not None else time.time()
+        since = now - period
+        step = period / self.HISTORY_POINTS
+        # по каждому столбцу: сумма игроков * замеров и количество замеров
+        weighted = [0.0] * self.HISTORY_POINTS
+        samples = [0] * self.HISTORY_POINTS
+        online = peak = total = 0
+        for ts, resolution, n, n_online, players, players_peak, max_players in rows:
+            index = min(self.HISTORY_POINTS - 1, max(0, int((ts - since) // step)))
+            weighted[index] += players * n
+            samples[index] += n
+            total += n
+            online += n_online
+            peak = max(peak, players_peak)
+
+        values = [weighted[i] / samples[i] if samples[i] else None for i in range(self.HISTORY_POINTS)]
+        top = max((v for v in values if v is not None), default=0) or 1
+        chart = "".join("·" if v is None else self.SPARK_CHARS[min(len(self.SPARK_CHARS) - 1,
+                                                                    int(v / top * len(self.SPARK_CHARS)))]
+                        for v in values)
+        last = rows[-1]
+        average = sum(weighted) / total if total else 0
+        time_format = "%H:%M %d.%m"
+        return (f"{title}\n\n"
+                f"{frmt.hcode(chart)}\n"
+                f"{time.strftime(time_format, time.localtime(since))} — {time.strftime(time_format, time.localtime(now))}\n\n"
+                f"• Игроков сейчас: {last[4]} / {last[6]}\n"
+                f"• В среднем: {average:.0f}, максимум: {peak}\n"
+                f"• В сети: {online / total * 100:.0f}% замеров ({total})")
+
+    def get_fav_status(self, user_id, timeout: float = FAV_STATUS_TIMEOUT) -> str:
+        """Параллельно проверяет все избранные сервера пользователя с общим таймаутом"""
+        fav_servers = list(self.session.get_fav_servers(user_id).items())[:self.MAX_FAV_SERVERS]
+        futures = {name: self.fav_status_executor.submit(get_mc_server_info, address)
+                   for name, address in fav_servers}
+        wait(futures.values(), timeout=timeout)
+
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()  # ещё не начатые запросы не нужны
+                continue
+            try:
+                results[name] = future.result()
+            except Exception as ex:
+                results[name] = ex
+        return self.format_fav_status(fav_servers, results, timeout)
+
+    def inline_server_item(self, query, text=None, error=None, age=None):
+        """Результат инлайн-запроса с описанием сервера или ошибкой; age - возраст данных в секундах"""
+        age_note = f" (данные {int(age)} с назад)" if age is not None and age >= 1 else ""
+        if error is not None:
+            return telebot.types.InlineQueryResultArticle(
+                id='error',
+                title="Ошибка",
+                description=f"{error}{age_note}",
+                input_message_content=telebot.types.InputTextMessageContent(
+                    message_text=f"Ошибка: {str(error)}",
+                    parse_mode="HTML"
+                )
+            )
+        return telebot.types.InlineQueryResultArticle(
+            id=query,
+            title=f"Информация о сервере {query}",
+            description=f"Нажмите чтобы отправить информацию{age_note}",
+            input_message_content=telebot.types.InputTextMessageContent(
+                message_text=text,
+                parse_mode="HTML"
+            )
+        )
+
+    def inline_snapshot_item(self, query, snapshot):
+        """Результат инлайн-запроса по сохранённому в кэше ответу"""
+        try:
+            text = self.render_server_description(query, snapshot.result())
+        except GetServerInfoError as e:
+            return self.inline_server_item(query, error=e, age=snapshot.age)
         except ConnectionError:
-            raise GetServerInfoError("Ошибка подключения!") # нету интернета
+            return self.inline_server_item(query, error=GetServerInfoError("Ошибка подключения!"), age=snapshot.age)
+        return self.inline_server_item(query, text, age=snapshot.age)
+
+    @staticmethod
+    def inline_cache_time(snapshot) -> int:
+        """Сколько Telegram может кэшировать ответ: пока данные не устарели"""
+        return max(1, int(snapshot.expires - time.monotonic()))
+
+    def _inline_register(self, user_id) -> int:
+        with self._inline_lock:
+            self._inline_seq += 1
+            self._inline_latest[user_id] = self._inline_seq
+            return self._inline_seq
+
+    def _inline_is_latest(self, user_id, seq) -> bool:
+        with self._inline_lock:
+            if self._inline_latest.get(user_id) != seq:
+                return False
+            del self._inline_latest[user_id]
+            return True
+
+    def debounce_inline(self, user_id, fn) -> None:
+        """
+        Через INLINE_DEBOUNCE секунд выполняет fn в inline_executor, если пользователь
+        за это время не ввёл новый запрос. Поток обработчика не ждёт: он сразу освобождается
+        для других апдейтов, а предыдущий отложенный запрос пользователя отменяется.
+        """
+        seq = self._inline_register(user_id)
+
+        def fire():
+            with self._inline_lock:
+                if self._inline_timers.get(user_id) is timer:
+                    del self._inline_timers[user_id]
+            if self._inline_is_latest(user_id, seq):
+                self.inline_executor.submit(fn)
+
+        timer = threading.Timer(INLINE_DEBOUNCE, fire)
+        timer.daemon = True
+        with self._inline_lock:
+            previous = self._inline_timers.get(user_id)
+            self._inline_timers[user_id] = timer
+        if previous is not None:
+            previous.cancel()
+        timer.start()
+
+    def answer_inline_lookup(self, inline_query, query):
+        """Отложенный ответ на инлайн-запрос сервера, которого ещё нет в кэше"""
+        try:
+            results = [self.inline_rate_limit_item(query, inline_query.from_user.id)]
+            is_personal = results[0] is not None
+            if not is_personal:
+                try:
+                    results = [self.inline_server_item(query, self.generate_server_description(query))]
+                except GetServerInfoError as e:
+                    results = [self.inline_server_item(query, error=e)]
+            self.bot.answer_inline_query(inline_query.id, results, cache_time=1, is_personal=is_personal)
+        except Exception as e:
+            logger.error(f"Error in inline handler: {str(e)}")
 
     def get_markup(self, user_id):
         fav_servers = self.session.get_fav_servers(user_id)
@@ -190,196 +704,248 @@ class Bot():
         self.bot.send_message(msg.chat.id, f"Добавили сервер {frmt.hcode(html.escape(name))} в избранные", reply_to_message_id=msg.id,
                               reply_markup=self.get_markup(msg.from_user.id), parse_mode="html")  # отправляем сообщение если всё хорошо
 
-    def mainloop(self):
-        try:
-            bot = self.bot
+    def register_handlers(self):
+        bot = self.bot
 
-            # обработчик всех сообщений не начинающихся с '/'
-            @bot.message_handler(regexp=r"^((?!\/).|\n)+$")
-            def handle_other_messages(message: telebot.types.Message) -> None:
-                # регистрируем нового пользователя в базе данных
-                new_user = User(id=message.from_user.id)
-                self.session.add_user(new_user)
-                on_msg(message)
-                # получаем список избранных серверов пользователя
+        # обработчик всех сообщений не начинающихся с '/'
+        @bot.message_handler(regexp=r"^((?!\/).|\n)+$")
+        @handler_seconds.time(command="text")
+        def handle_other_messages(message: telebot.types.Message) -> None:
+            # регистрируем нового пользователя в базе данных
+            new_user = User(id=message.from_user.id)
+            self.session.add_user(new_user)
+            on_msg(message)
+            # получаем список избранных серверов пользователя
+            fav_servers = self.session.get_fav_servers(message.from_user.id)
+            if message.text in fav_servers.keys():
+                wait_time = self.rate_limit_wait(message.from_user.id, message.chat.id)
+                if wait_time:
+                    bot.reply_to(message, self.rate_limit_text(wait_time),
+                                 reply_markup=self.get_markup(message.from_user.id))
+                    return
+                try:
+                    bot.reply_to(message, self.generate_server_description(fav_servers[message.text]),
+                                 parse_mode="HTML", reply_markup=self.get_markup(message.from_user.id))
+                except GetServerInfoError:
+                    bot.reply_to(message, "Ошибка!", parse_mode="HTML",
+                                 reply_markup=self.get_markup(message.from_user.id))
+            else:
+                send_data(message)
+
+
+        @bot.message_handler(commands=['start'])
+        @handler_seconds.time(command="start")
+        def handle_start(message: telebot.types.Message) -> None:
+            """Команда /start"""
+            # регистрируем нового пользователя
+            new_user = User(id=message.from_user.id)
+            self.session.add_user(new_user)
+            # логаем входящее сообщение
+            on_msg(message)
+            # приветственное сообщение пользователю
+            bot.send_message(message.chat.id, f"Добро пожаловать, {message.from_user.first_name}!\n"
+                                              f"\n"
+                                              f"Я бот, который позволяет получать различную информацию о Minecraft серверах\n"
+                                              f"Для получения справки: /help",
+                             reply_markup=self.get_markup(message.from_user.id))
+
+        @bot.message_handler(commands=['fav'])
+        @handler_seconds.time(command="fav")
+        def handle_fav(message: telebot.types.Message) -> None:
+            """Команда /fav"""
+            # регистрируем нового пользователя
+            new_user = User(id=message.from_user.id)
+            self.session.add_user(new_user)
+            # логаем входящее сообщение
+            on_msg(message)
+            ls = message.text.split()
+            # если команда без аргументов (/fav), показываем список избранных серверов
+            if len(ls) == 1:
                 fav_servers = self.session.get_fav_servers(message.from_user.id)
-                if message.text in fav_servers.keys():
+                bot.send_message(message.chat.id, f"Ваши избранные сервера:\n{print_fav_servers(fav_servers)}",
+                                 parse_mode="HTML", reply_markup=self.get_markup(message.from_user.id))
+            # /fav status - проверяем все избранные сервера
+            elif len(ls) == 2 and ls[1] in ["status", "s"]:
+                # каждый избранный сервер - отдельный запрос
+                cost = max(1, len(self.session.get_fav_servers(message.from_user.id)))
+                wait_time = self.rate_limit_wait(message.from_user.id, message.chat.id, cost)
+                if wait_time:
+                    bot.send_message(message.chat.id, self.rate_limit_text(wait_time), reply_to_message_id=message.id)
+                    return
+                bot.send_message(message.chat.id, self.get_fav_status(message.from_user.id),
+                                 parse_mode="HTML", reply_to_message_id=message.id)
+            # если указано два параметра (/fav add server-address), добавляем сервер
+            elif len(ls) == 3:
+                if ls[1] in ["add", "a", "+"]:
+                    self.add_fav_server(message, ls[2], ls[2])
+                # если указано два параметра (/fav del server-name), удаляем сервер
+                elif ls[1] in ["del", "remove", "-"]:
+                    fav_servers = self.session.get_fav_servers(message.from_user.id)
                     try:
-                        bot.reply_to(message, self.generate_server_description(fav_servers[message.text]),
-                                     parse_mode="HTML", reply_markup=self.get_markup(message.from_user.id))
-                    except GetServerInfoError:
-                        bot.reply_to(message, "Ошибка!", parse_mode="HTML",
-                                     reply_markup=self.get_markup(message.from_user.id))
+                        del fav_servers[ls[2]]
+                        self.session.set_fav_servers(message.from_user.id, fav_servers)
+                        bot.send_message(message.chat.id, f"Удалил сервер", reply_to_message_id=message.id)
+                    except:
+                        bot.send_message(message.chat.id, f"Сервер не найден", reply_to_message_id=message.id)
                 else:
-                    handle_stats(message)
+                    bot.send_message(message.chat.id, self.INVILID_CMD_USE,
+                                     reply_to_message_id=message.id)
 
+            elif len(ls) == 4:
+                if ls[1] in ["add", "a", "+"]:
+                    self.add_fav_server(message, ls[2], ls[3])
+                else:
+                    bot.send_message(message.chat.id, self.INVILID_CMD_USE,
+                                     reply_to_message_id=message.id)
 
-            @bot.message_handler(commands=['start'])
-            def handle_start(message: telebot.types.Message) -> None:
-                """Команда /start"""
-                # регистрируем нового пользователя
-                new_user = User(id=message.from_user.id)
-                self.session.add_user(new_user)
-                # логаем входящее сообщение
-                on_msg(message)
-                # приветственное сообщение пользователю
-                bot.send_message(message.chat.id, f"Добро пожаловать, {message.from_user.first_name}!\n"
-                                                  f"\n"
-                                                  f"Я бот, который позволяет получать различную информацию о Minecraft серверах\n"
-                                                  f"Для получения справки: /help",
-                                 reply_markup=self.get_markup(message.from_user.id))
+            else:
+                bot.send_message(message.chat.id, self.INVILID_CMD_USE, reply_to_message_id=message.id)
 
-            @bot.message_handler(commands=['fav'])
-            def handle_fav(message: telebot.types.Message) -> None:
-                """Команда /fav"""
-                # регистрируем нового пользователя
-                new_user = User(id=message.from_user.id)
-                self.session.add_user(new_user)
-                # логаем входящее сообщение
-                on_msg(message)
-                ls = message.text.split()
-                # если команда без аргументов (/fav), показываем список избранных серверов
-                if len(ls) == 1:
-                    fav_servers = self.session.get_fav_servers(message.from_user.id)
-                    bot.send_message(message.chat.id, f"Ваши избранные сервера:\n{print_fav_servers(fav_servers)}",
-                                     parse_mode="HTML", reply_markup=self.get_markup(message.from_user.id))
-                # если указано два параметра (/fav add server-address), добавляем сервер
-                elif len(ls) == 3:
-                    if ls[1] in ["add", "a", "+"]:
-                        self.add_fav_server(message, ls[2], ls[2])
-                    # если указано два параметра (/fav del server-name), удаляем сервер
-                    elif ls[1] in ["del", "remove", "-"]:
-                        fav_servers = self.session.get_fav_servers(message.from_user.id)
-                        try:
-                            del fav_servers[ls[2]]
-                            self.session.set_fav_servers(message.from_user.id, fav_servers)
-                            bot.send_message(message.chat.id, f"Удалил сервер", reply_to_message_id=message.id)
-                        except:
-                            bot.send_message(message.chat.id, f"Сервер не найден", reply_to_message_id=message.id)
-                    else:
-                        bot.send_message(message.chat.id, self.INVILID_CMD_USE,
-                                         reply_to_message_id=message.id)
+        @bot.message_handler(commands=['help'])
+        @handler_seconds.time(command="help")
+        def handle_help(message: telebot.types.Message) -> None:
+            """Команда /help"""
+            # регистрируем нового пользователя
+            new_user = User(id=message.from_user.id)
+            self.session.add_user(new_user)
+            # логаем входящее сообщение
+            on_msg(message)
+            # отсылаем справочный текст
+            bot.send_message(message.chat.id, self.HELP_TEXT, parse_mode='html',
+                             reply_markup=self.get_markup(message.from_user.id))
 
-                elif len(ls) == 4:
-                    if ls[1] in ["add", "a", "+"]:
-                        self.add_fav_server(message, ls[2], ls[3])
-                    else:
-                        bot.send_message(message.chat.id, self.INVILID_CMD_USE,
-                                         reply_to_message_id=message.id)
+        def send_data(message):
+            """Запрос информации о сервере"""
+            try:
+                args = message.text.split()
+                if message.text[0] == "/":
+                    if len(args) < 2:
+                        raise ValueError
 
+                    ip = args[1]
                 else:
-                    bot.send_message(message.chat.id, self.INVILID_CMD_USE, reply_to_message_id=message.id)
+                    ip = args[0]
 
-            @bot.message_handler(commands=['help'])
-            def handle_help(message: telebot.types.Message) -> None:
-                """Команда /help"""
-                # регистрируем нового пользователя
-                new_user = User(id=message.from_user.id)
-                self.session.add_user(new_user)
-                # логаем входящее сообщение
-                on_msg(message)
-                # отсылаем справочный текст
-                bot.send_message(message.chat.id, self.HELP_TEXT, parse_mode='html',
-                                 reply_markup=self.get_markup(message.from_user.id))
+                wait_time = self.rate_limit_wait(message.from_user.id, message.chat.id)
+                if wait_time:
+                    bot.reply_to(message, self.rate_limit_text(wait_time))
+                    return
+                response = self.generate_server_description(ip)
 
-            def send_data(message):
-                """Запрос информации о сервере"""
-                try:
-                    args = message.text.split()
-                    if message.text[0] == "/":
-                        if len(args) < 2:
-                            raise ValueError
+            except ValueError:
+                # если не указан IP-адрес
+                error_msg = f"{frmt.hbold('Ошибка:')} Не указан IP-адрес сервера!\n\nПример использования: {frmt.hcode('/stats 2b2t.org')}"
+                bot.reply_to(message, error_msg, parse_mode='html')
+            except GetServerInfoError as ex:
+                error_msg = f"{frmt.hbold('Ошибка:')} {ex}"
+                bot.reply_to(message, error_msg, parse_mode='html')
+            except ConnectionError as e:
+                # обрабатываем проблемы с соединением
+                bot.reply_to(message, frmt.hbold(f"⚠️ Ошибка подключения: {str(e)}"), parse_mode='html')
 
-                        ip = args[1]
-                    else:
-                        ip = args[0]
+            else:
+                # отправляем информацию о сервере
+                bot.send_message(message.chat.id, response, parse_mode='html', reply_to_message_id=message.id)
+                # фиксируем запрос в статистике пользователя
+                self.session.add_request(message.from_user.id)
 
-                    response = self.generate_server_description(ip)
+        # обработчики команд для получения статистики
+        @bot.message_handler(commands=['stats', 'info'])
+        @handler_seconds.time(command="stats")
+        def handle_stats(message: telebot.types.Message) -> None:
+            new_user = User(id=message.from_user.id)
+            self.session.add_user(new_user)
+            send_data(message)
 
-                except ValueError:
-                    # если не указан IP-адрес
-                    error_msg = f"{frmt.hbold('Ошибка:')} Не указан IP-адрес сервера!\n\nПример использования: {frmt.hcode('/stats 2b2t.org')}"
-                    bot.reply_to(message, error_msg, parse_mode='html')
-                except GetServerInfoError as ex:
-                    error_msg = f"{frmt.hbold('Ошибка:')} {ex}"
-                    bot.reply_to(message, error_msg, parse_mode='html')
-                except ConnectionError as e:
-                    # обрабатываем проблемы с соединением
-                    bot.reply_to(message, frmt.hbold(f"⚠️ Ошибка подключения: {str(e)}"), parse_mode='html')
+        @bot.message_handler(commands=['history'])
+        @handler_seconds.time(command="history")
+        def handle_history(message: telebot.types.Message) -> None:
+            """Команда /history ADDRESS [24h|7d|30d]"""
+            self.session.add_user(User(id=message.from_user.id))
+            on_msg(message)
+            args = message.text.split()
+            period = self.parse_history_period(args[2]) if len(args) == 3 else 86400
+            if len(args) not in (2, 3) or period is None:
+                bot.reply_to(message, f"Пример использования: {frmt.hcode('/history 2b2t.org 7d')}", parse_mode='html')
+                return
+            address = normalize_address(args[1])
+            rows = self.session.get_server_history(address, time.time() - period)
+            bot.reply_to(message, self.render_history(address, rows, period), parse_mode='html')
 
-                else:
-                    # отправляем информацию о сервере
-                    bot.send_message(message.chat.id, response, parse_mode='html', reply_to_message_id=message.id)
-                    # фиксируем запрос в статистике пользователя
-                    self.session.add_request(message.from_user.id)
-
-            # обработчики команд для получения статистики
-            @bot.message_handler(commands=['stats', 'info'])
-            def handle_stats(message: telebot.types.Message) -> None:
-                new_user = User(id=message.from_user.id)
-                self.session.add_user(new_user)
-                send_data(message)
-
-            @bot.inline_handler(lambda query: True)
-            def handle_inline_query(inline_query):
-                try:
-                    # Логируем запрос
-                    logger.info(f"Inline query from {inline_query.from_user.id}: {inline_query.query}")
+        @bot.inline_handler(lambda query: True)
+        @handler_seconds.time(command="inline")
+        def handle_inline_query(inline_query):
+            try:
+                # Логируем запрос
+                logger.info(f"Inline query from {inline_query.from_user.id}: {inline_query.query}")
 
-                    # Создаём пользователя если его нет
-                    new_user = User(id=inline_query.from_user.id)
-                    self.session.add_user(new_user)
+                # Создаём пользователя если его нет
+                new_user = User(id=inline_query.from_user.id)
+                self.session.add_user(new_user)
 
-                    results = []
-                    query = inline_query.query.strip()
+                results = []
+                cache_time = 1
+                is_personal = False  # сводку избранного и ошибки ограничения нельзя показывать другим пользователям
+                query = inline_query.query.strip()
 
-                    if not query:
-                        # Если запрос пустой - показываем подсказку
+                if not query:
+                    # Если запрос пустой - показываем подсказку
+                    item = telebot.types.InlineQueryResultArticle(
+                        id='1',
+                        title="Введите адрес сервера Minecraft",
+                        description="Например: mc.example.com",
+                        input_message_content=telebot.types.InputTextMessageContent(
+                            message_text="Введите адрес сервера Minecraft для получения информации",
+                            parse_mode="HTML"
+                        )
+                    )
+                    results.append(item)
+                elif query.lower() == "fav":
+                    # статус всех избранных серверов
+                    is_personal = True
+                    cost = max(1, len(self.session.get_fav_servers(inline_query.from_user.id)))
+                    item = self.inline_rate_limit_item(query, inline_query.from_user.id, cost)
+                    if item is None:
                         item = telebot.types.InlineQueryResultArticle(
-                            id='1',
-                            title="Введите адрес сервера Minecraft",
-                            description="Например: mc.example.com",
+                            id=f"fav_{inline_query.from_user.id}",
+                            title="Статус избранных серверов",
+                            description="Нажмите чтобы отправить сводку",
                             input_message_content=telebot.types.InputTextMessageContent(
-                                message_text="Введите адрес сервера Minecraft для получения информации",
+                                message_text=self.get_fav_status(inline_query.from_user.id, INLINE_FAV_TIMEOUT),
                                 parse_mode="HTML"
                             )
                         )
-                        results.append(item)
+                    results.append(item)
+                else:
+                    snapshot = peek_mc_server_info(query)
+                    if snapshot is not None:
+                        # отвечаем сразу последними известными данными, устаревшие обновляем в фоне
+                        if not snapshot.is_fresh():
+                            refresh_mc_server_info(query)
+                        results.append(self.inline_snapshot_item(query, snapshot))
+                        cache_time = self.inline_cache_time(snapshot)
                     else:
-                        # Обрабатываем запрос
-                        try:
-                            server_info = self.generate_server_description(query)
-                            item = telebot.types.InlineQueryResultArticle(
-                                id=query,
-                                title=f"Информация о сервере {query}",
-                                description="Нажмите чтобы отправить информацию",
-                                input_message_content=telebot.types.InputTextMessageContent(
-                                    message_text=server_info,
-                                    parse_mode="HTML"
-                                )
-                            )
-                            results.append(item)
-                        except GetServerInfoError as e:
-                            item = telebot.types.InlineQueryResultArticle(
-                                id='error',
-                                title="Ошибка",
-                                description=str(e),
-                                input_message_content=telebot.types.InputTextMessageContent(
-                                    message_text=f"Ошибка: {str(e)}",
-                                    parse_mode="HTML"
-                                )
-                            )
-                            results.append(item)
+                        # ждём, пока пользователь допечатает адрес: запрашиваем только последний ввод
+                        self.debounce_inline(inline_query.from_user.id,
+                                             lambda: self.answer_inline_lookup(inline_query, query))
+                        return
 
-                    # Отправляем ответ
-                    bot.answer_inline_query(inline_query.id, results, cache_time=1)
+                # Отправляем ответ
+                bot.answer_inline_query(inline_query.id, results, cache_time=cache_time, is_personal=is_personal)
 
-                except Exception as e:
-                    logger.error(f"Error in inline handler: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error in inline handler: {str(e)}")
 
+    def mainloop(self):
+        metrics_server = None
+        try:
+            self.register_handlers()
+            register_metrics(self.session, self)
+            metrics_server = start_metrics_server()
             try:
-                bot.remove_webhook()
-                bot.polling(non_stop=True, interval=1, timeout=30)
+                self.prefetch = start_prefetch(self.session)
+                self.bot.remove_webhook()
+                self.bot.polling(non_stop=True, interval=1, timeout=30)
             except telebot.apihelper.ApiTelegramException:
                 print("telebot.apihelper.ApiTelegramException 95747")
         except requests.exceptions.ConnectionError as ex:
@@ -388,7 +954,452 @@ class Bot():
         except telebot.apihelper.ApiTelegramException:
             print("telebot.apihelper.ApiTelegramException 95747")
 
+        finally:
+            if metrics_server is not None:
+                metrics_server.stop()
+            if self.prefetch is not None:
+                self.prefetch.stop()
+            # записываем накопленные счётчики запросов
+            self.session.close()
+
+    def process_update(self, update: dict) -> None:
+        """Обрабатывает апдейт, полученный через webhook"""
+        self.bot.process_new_updates([telebot.types.Update.de_json(update)])
+
+    def create_webhook_server(self, generate_secret: bool = False) -> WebhookServer:
+        """
+        Без секретного токена endpoint принимал бы апдейты от кого угодно, поэтому
+        если WEBHOOK_SECRET не задан, токен генерируется (generate_secret=True, когда
+        webhook в Telegram устанавливает сам бот) или сервер не запускается.
+        """
+        secret = WEBHOOK_SECRET
+        if not secret:
+            if not generate_secret:
+                raise RuntimeError("WEBHOOK_SECRET не задан: без него webhook не запускается")
+            secret = secrets.token_urlsafe(32)
+            logger.info("WEBHOOK_SECRET не задан, сгенерирован случайный токен")
+        self.session.user_cache.configure(ttl=min(USER_CACHE_TTL, WEBHOOK_USER_CACHE_TTL))
+        return WebhookServer(self.process_update, secret_token=secret, path=WEBHOOK_PATH,
+                             queue_size=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_WORKERS)
+
+    def webhook_loop(self):
+        """Приём апдейтов через webhook вместо polling"""
+        self.register_handlers()
+        # токен можно сгенерировать, только если бот сам передаёт его в set_webhook
+        server = self.create_webhook_server(generate_secret=bool(WEBHOOK_URL))
+        register_metrics(self.session, self, server)
+        metrics_server = start_metrics_server()
+        self.prefetch = start_prefetch(self.session)
+        try:
+            if WEBHOOK_URL:
+                self.bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=server.secret_token,
+                                     max_connections=min(100, max(1, WEBHOOK_WORKERS * 2)))
+            server.run(WEBHOOK_HOST, WEBHOOK_PORT)
+        finally:
+            server.stop()
+            if metrics_server is not None:
+                metrics_server.stop()
+            if self.prefetch is not None:
+                self.prefetch.stop()
+            self.session.close()
+
+
+def create_webhook_app():
+    """
+    Flask-приложение для запуска под WSGI-сервером, например:
+    gunicorn -w 1 --threads 16 "main:create_webhook_app()"
+
+    Webhook в Telegram нужно установить отдельно (или запустить бот с BOT_MODE=webhook)
+    с тем же WEBHOOK_SECRET; без него приложение не создаётся.
+    """
+    b = Bot(threaded=False)
+    b.register_handlers()
+    server = b.create_webhook_server()
+    register_metrics(b.session, b, server)
+    server.start_workers()
+    b.prefetch = start_prefetch(b.session)
+    return server.app
+
+
+def run_worker(index: int, updates) -> None:
+    """Рабочий процесс режима workers: обрабатывает апдейты своей части пользователей"""
+    b = Bot(threaded=False)
+    b.register_handlers()
+    register_metrics(b.session, b)
+    metrics_server = start_metrics_server(port_offset=index + 1)
+    # популярные сервера обновляет один процесс, остальные получают данные через общий кэш
+    b.prefetch = start_prefetch(b.session) if index == 0 else None
+    try:
+        serve_partition(updates, b.process_update, threads=BOT_THREADS, processes=WORKER_PROCESSES)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        if b.prefetch is not None:
+            b.prefetch.stop()
+        # записываем накопленные счётчики запросов
+        b.session.close()
+
+
+def run_workers():
+    """
+    Режим workers: этот процесс получает апдейты через getUpdates и раздаёт их
+    WORKER_PROCESSES рабочим процессам по id пользователя.
+    Метрики процесса-распределителя - на METRICS_PORT, рабочих - на METRICS_PORT + 1 + номер.
+    """
+    instrument_telegram_api()
+    create_schema(DB_PATH)
+    pool = WorkerPool(run_worker, WORKER_PROCESSES, queue_size=WORKER_QUEUE_SIZE).start()
+    gauge("mcbot_queue_depth", "Длина очередей", ["queue"], pool.queue_sizes)
+    gauge("mcbot_workers_alive", "Работающие рабочие процессы", fn=pool.alive)
+    gauge("mcbot_workers_restarts", "Перезапуски упавших рабочих процессов", fn=lambda: pool.restarts)
+    gauge("mcbot_workers_dropped", "Апдейты, отброшенные, пока рабочий процесс не работал",
+          fn=lambda: pool.dropped)
+    metrics_server = start_metrics_server()
+    offset = None
+    try:
+        telebot.TeleBot(TOKEN, threaded=False).remove_webhook()
+        while True:
+            try:
+                updates = apihelper.get_updates(TOKEN, offset=offset, timeout=30, long_polling_timeout=30)
+            except (requests.exceptions.RequestException, telebot.apihelper.ApiException) as ex:
+                logger.error(f"getUpdates failed: {ex}")
+                time.sleep(1)
+                continue
+            for update in updates:
+                offset = update["update_id"] + 1
+                pool.submit(update)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+
+
+class AsyncBot(Bot):
+    """
+    Асинхронный режим бота: AsyncTeleBot и корутины вместо потоков.
+
+    Каждый апдейт обрабатывается отдельной задачей, число одновременно
+    обрабатываемых апдейтов ограничено concurrency.
+    """
+
+    def __init__(self, concurrency: int = 1000):
+        self.bot = AsyncTeleBot(TOKEN)
+        self.session = AsyncMySession(create_session(), max_workers=DB_POOL_SIZE)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.fav_status_semaphore = asyncio.Semaphore(FAV_STATUS_WORKERS)
+        self._init_inline_state()
+        self._init_rate_limits()
+        self._background_tasks = set()
+        self.prefetch = None
+        instrument_telegram_api()
+
+    async def debounce_inline(self, user_id) -> bool:
+        """Ждёт INLINE_DEBOUNCE секунд; False, если пользователь за это время ввёл новый запрос"""
+        seq = self._inline_register(user_id)
+        await asyncio.sleep(INLINE_DEBOUNCE)
+        return self._inline_is_latest(user_id, seq)
+
+    def refresh_in_background(self, address):
+        """Обновляет данные сервера в фоновой задаче"""
+        async def refresh():
+            try:
+                await async_get_mc_server_info(address)
+            except Exception:
+                pass
+
+        task = asyncio.ensure_future(refresh())
+        self._background_tasks.add(task)  # храним ссылку, чтобы задачу не удалил сборщик мусора
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def generate_server_description(self, address: str) -> str:
+        """Описание сервера"""
+        try:
+            data = await async_get_mc_server_info(address)
+        except asyncio.TimeoutError:
+            raise GetServerInfoError(f'Превышено время ожидания ответа от сервера {address}')
+        except ConnectionError:
+            raise GetServerInfoError("Ошибка подключения!")
+
+        return self.render_server_description(address, data)
+
+    async def get_fav_status(self, user_id, timeout: float = FAV_STATUS_TIMEOUT) -> str:
+        """Параллельно проверяет все избранные сервера пользователя с общим таймаутом"""
+        fav_servers = list((await self.session.get_fav_servers(user_id)).items())[:self.MAX_FAV_SERVERS]
+
+        async def lookup(address):
+            async with self.fav_status_semaphore:
+                return await async_get_mc_server_info(address)
+
+        tasks = {name: asyncio.ensure_future(lookup(address)) for name, address in fav_servers}
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+
+        results = {}
+        for name, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                continue
+            try:
+                results[name] = task.result()
+            except Exception as ex:
+                results[name] = ex
+        return self.format_fav_status(fav_servers, results, timeout)
+
+    async def get_markup(self, user_id):
+        fav_servers = await self.session.get_fav_servers(user_id)
+        keyboard = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True)
+        for i in fav_servers.keys():
+            keyboard.add(telebot.types.KeyboardButton(text=f"{i}"))
+        return keyboard
+
+    async def add_fav_server(self, msg, address, name):
+        fav_servers = await self.session.get_fav_servers(msg.from_user.id)
+        if len(fav_servers) > self.MAX_FAV_SERVERS:
+            await self.bot.send_message(msg.chat.id,
+                                        f"Не удалось добавить сервер в избранные. \nПревышено максимальное количество избранных серверов: {self.MAX_FAV_SERVERS}",
+                                        reply_to_message_id=msg.id,
+                                        reply_markup=await self.get_markup(msg.from_user.id))
+            return
+        fav_servers[f"{name}"] = address
+        await self.session.set_fav_servers(msg.from_user.id, fav_servers)
+        await self.bot.send_message(msg.chat.id, f"Добавили сервер {frmt.hcode(html.escape(name))} в избранные",
+                                    reply_to_message_id=msg.id,
+                                    reply_markup=await self.get_markup(msg.from_user.id), parse_mode="html")
+
+    def limited(self, handler):
+        """Ограничивает число одновременно выполняющихся обработчиков"""
+        async def wrapper(update):
+            async with self.semaphore:
+                await handler(update)
+        return wrapper
+
+    def register_handlers(self):
+        bot = self.bot
+
+        @bot.message_handler(regexp=r"^((?!\/).|\n)+$")
+        @handler_seconds.time(command="text")
+        @self.limited
+        async def handle_other_messages(message: telebot.types.Message) -> None:
+            await self.session.add_user(User(id=message.from_user.id))
+            on_msg(message)
+            fav_servers = await self.session.get_fav_servers(message.from_user.id)
+            if message.text in fav_servers.keys():
+                wait_time = self.rate_limit_wait(message.from_user.id, message.chat.id)
+                if wait_time:
+                    await bot.reply_to(message, self.rate_limit_text(wait_time),
+                                       reply_markup=await self.get_markup(message.from_user.id))
+                    return
+                try:
+                    await bot.reply_to(message, await self.generate_server_description(fav_servers[message.text]),
+                                       parse_mode="HTML", reply_markup=await self.get_markup(message.from_user.id))
+                except GetServerInfoError:
+                    await bot.reply_to(message, "Ошибка!", parse_mode="HTML",
+                                       reply_markup=await self.get_markup(message.from_user.id))
+            else:
+                await send_data(message)
+
+        @bot.message_handler(commands=['start'])
+        @handler_seconds.time(command="start")
+        @self.limited
+        async def handle_start(message: telebot.types.Message) -> None:
+            """Команда /start"""
+            await self.session.add_user(User(id=message.from_user.id))
+            on_msg(message)
+            await bot.send_message(message.chat.id, f"Добро пожаловать, {message.from_user.first_name}!\n"
+                                                    f"\n"
+                                                    f"Я бот, который позволяет получать различную информацию о Minecraft серверах\n"
+                                                    f"Для получения справки: /help",
+                                   reply_markup=await self.get_markup(message.from_user.id))
+
+        @bot.message_handler(commands=['fav'])
+        @handler_seconds.time(command="fav")
+        @self.limited
+        async def handle_fav(message: telebot.types.Message) -> None:
+            """Команда /fav"""
+            await self.session.add_user(User(id=message.from_user.id))
+            on_msg(message)
+            ls = message.text.split()
+            if len(ls) == 1:
+                fav_servers = await self.session.get_fav_servers(message.from_user.id)
+                await bot.send_message(message.chat.id, f"Ваши избранные сервера:\n{print_fav_servers(fav_servers)}",
+                                       parse_mode="HTML", reply_markup=await self.get_markup(message.from_user.id))
+            elif len(ls) == 2 and ls[1] in ["status", "s"]:
+                cost = max(1, len(await self.session.get_fav_servers(message.from_user.id)))
+                wait_time = self.rate_limit_wait(message.from_user.id, message.chat.id, cost)
+                if wait_time:
+                    await bot.send_message(message.chat.id, self.rate_limit_text(wait_time),
+                                           reply_to_message_id=message.id)
+                    return
+                await bot.send_message(message.chat.id, await self.get_fav_status(message.from_user.id),
+                                       parse_mode="HTML", reply_to_message_id=message.id)
+            elif len(ls) == 3 and ls[1] in ["add", "a", "+"]:
+                await self.add_fav_server(message, ls[2], ls[2])
+            elif len(ls) == 3 and ls[1] in ["del", "remove", "-"]:
+                fav_servers = await self.session.get_fav_servers(message.from_user.id)
+                if ls[2] in fav_servers:
+                    del fav_servers[ls[2]]
+                    await self.session.set_fav_servers(message.from_user.id, fav_servers)
+                    await bot.send_message(message.chat.id, f"Удалил сервер", reply_to_message_id=message.id)
+                else:
+                    await bot.send_message(message.chat.id, f"Сервер не найден", reply_to_message_id=message.id)
+            elif len(ls) == 4 and ls[1] in ["add", "a", "+"]:
+                await self.add_fav_server(message, ls[2], ls[3])
+            else:
+                await bot.send_message(message.chat.id, self.INVILID_CMD_USE, reply_to_message_id=message.id)
+
+        @bot.message_handler(commands=['help'])
+        @handler_seconds.time(command="help")
+        @self.limited
+        async def handle_help(message: telebot.types.Message) -> None:
+            """Команда /help"""
+            await self.session.add_user(User(id=message.from_user.id))
+            on_msg(message)
+            await bot.send_message(message.chat.id, self.HELP_TEXT, parse_mode='html',
+                                   reply_markup=await self.get_markup(message.from_user.id))
+
+        async def send_data(message):
+            """Запрос информации о сервере"""
+            try:
+                args = message.text.split()
+                if message.text[0] == "/":
+                    if len(args) < 2:
+                        raise ValueError
+                    ip = args[1]
+                else:
+                    ip = args[0]
+
+                wait_time = self.rate_limit_wait(message.from_user.id, message.chat.id)
+                if wait_time:
+                    await bot.reply_to(message, self.rate_limit_text(wait_time))
+                    return
+                response = await self.generate_server_description(ip)
+
+            except ValueError:
+                error_msg = f"{frmt.hbold('Ошибка:')} Не указан IP-адрес сервера!\n\nПример использования: {frmt.hcode('/stats 2b2t.org')}"
+                await bot.reply_to(message, error_msg, parse_mode='html')
+            except GetServerInfoError as ex:
+                await bot.reply_to(message, f"{frmt.hbold('Ошибка:')} {ex}", parse_mode='html')
+            else:
+                await bot.send_message(message.chat.id, response, parse_mode='html', reply_to_message_id=message.id)
+                await self.session.add_request(message.from_user.id)
+
+        @bot.message_handler(commands=['stats', 'info'])
+        @handler_seconds.time(command="stats")
+        @self.limited
+        async def handle_stats(message: telebot.types.Message) -> None:
+            await self.session.add_user(User(id=message.from_user.id))
+            await send_data(message)
+
+        @bot.message_handler(commands=['history'])
+        @handler_seconds.time(command="history")
+        @self.limited
+        async def handle_history(message: telebot.types.Message) -> None:
+            """Команда /history ADDRESS [24h|7d|30d]"""
+            await self.session.add_user(User(id=message.from_user.id))
+            on_msg(message)
+            args = message.text.split()
+            period = self.parse_history_period(args[2]) if len(args) == 3 else 86400
+            if len(args) not in (2, 3) or period is None:
+                await bot.reply_to(message, f"Пример использования: {frmt.hcode('/history 2b2t.org 7d')}",
+                                   parse_mode='html')
+                return
+            address = normalize_address(args[1])
+            rows = await self.session.get_server_history(address, time.time() - period)
+            await bot.reply_to(message, self.render_history(address, rows, period), parse_mode='html')
+
+        @bot.inline_handler(lambda query: True)
+        @handler_seconds.time(command="inline")
+        @self.limited
+        async def handle_inline_query(inline_query):
+            try:
+                logger.info(f"Inline query from {inline_query.from_user.id}: {inline_query.query}")
+                await self.session.add_user(User(id=inline_query.from_user.id))
+
+                cache_time = 1
+                is_personal = False  # сводку избранного и ошибки ограничения нельзя показывать другим пользователям
+                query = inline_query.query.strip()
+                if not query:
+                    item = telebot.types.InlineQueryResultArticle(
+                        id='1',
+                        title="Введите адрес сервера Minecraft",
+                        description="Например: mc.example.com",
+                        input_message_content=telebot.types.InputTextMessageContent(
+                            message_text="Введите адрес сервера Minecraft для получения информации",
+                            parse_mode="HTML"
+                        )
+                    )
+                elif query.lower() == "fav":
+                    is_personal = True
+                    cost = max(1, len(await self.session.get_fav_servers(inline_query.from_user.id)))
+                    item = self.inline_rate_limit_item(query, inline_query.from_user.id, cost)
+                    if item is None:
+                        item = telebot.types.InlineQueryResultArticle(
+                            id=f"fav_{inline_query.from_user.id}",
+                            title="Статус избранных серверов",
+                            description="Нажмите чтобы отправить сводку",
+                            input_message_content=telebot.types.InputTextMessageContent(
+                                message_text=await self.get_fav_status(inline_query.from_user.id, INLINE_FAV_TIMEOUT),
+                                parse_mode="HTML"
+                            )
+                        )
+                else:
+                    snapshot = peek_mc_server_info(query)
+                    if snapshot is not None:
+                        if not snapshot.is_fresh():
+                            self.refresh_in_background(query)
+                        item = self.inline_snapshot_item(query, snapshot)
+                        cache_time = self.inline_cache_time(snapshot)
+                    else:
+                        if not await self.debounce_inline(inline_query.from_user.id):
+                            return
+                        item = self.inline_rate_limit_item(query, inline_query.from_user.id)
+                        is_personal = item is not None
+                        if item is None:
+                            try:
+                                item = self.inline_server_item(query, await self.generate_server_description(query))
+                            except GetServerInfoError as e:
+                                item = self.inline_server_item(query, error=e)
+
+                await bot.answer_inline_query(inline_query.id, [item], cache_time=cache_time,
+                                              is_personal=is_personal)
+
+            except Exception as e:
+                logger.error(f"Error in inline handler: {str(e)}")
+
+    async def run(self):
+        self.register_handlers()
+        register_metrics(self.session.sync, self)
+        metrics_server = start_metrics_server()
+        self.prefetch = start_prefetch(self.session.sync)
+        try:
+            await self.bot.remove_webhook()
+            await self.bot.polling(non_stop=True, interval=1, timeout=30)
+        finally:
+            if metrics_server is not None:
+                metrics_server.stop()
+            if self.prefetch is not None:
+                self.prefetch.stop()
+            await self.session.close()
+            await get_async_http_client().close()
+            await self.bot.close_session()
+
+    def mainloop(self):
+        asyncio.run(self.run())
+
 
 if __name__ == '__main__':
-    b = Bot()
-    b.mainloop()
\ No newline at end of file
+    if BOT_MODE == "async":
+        b = AsyncBot(concurrency=int(os.getenv("ASYNC_CONCURRENCY", 1000)))
+        b.mainloop()
+    elif BOT_MODE == "webhook":
+        b = Bot(threaded=False)
+        b.webhook_loop()
+    elif BOT_MODE == "workers":
+        run_workers()
+    else:
+        b = Bot()
+        b.mainloop()
\ No newline at end of file
@@ -0,0 +1,362 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from models.errors import GetServerInfoError, ServerTimeoutError, UpstreamBusyError
+
+logger = logging.getLogger('my_app')
+
+
+class CacheEntry:
+    """Запись кэша: результат запроса или возникшее исключение"""
+    __slots__ = ("value", "error", "created", "expires")
+
+    def __init__(self, value: Any = None, error: Optional[BaseException] = None, ttl: float = 0.0):
+        self.value = value
+        self.error = error
+        self.created = time.monotonic()
+        self.expires = self.created + ttl
+
+    @property
+    def age(self) -> float:
+        """Возраст записи в секундах"""
+        return time.monotonic() - self.created
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+    def result(self) -> Any:
+        """Возвращает сохранённое значение или заново поднимает сохранённое исключение"""
+        if self.error is not None:
+            # создаём новый экземпляр, чтобы потоки не делили один traceback
+            raise type(self.error)(*self.error.args)
+        return self.value
+
+
+class LookupCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением по количеству записей.
+
+    Успешные ответы хранятся ttl секунд, ошибки и выключенные сервера -
+    negative_ttl секунд. Устаревшие записи не удаляются сразу, а вытесняются
+    по LRU, поэтому их можно получить через peek().
+
+    Если задано хранилище shared (SharedLookupStore), записи дублируются
+    в него, а при промахе берутся оттуда: так ответ, полученный одним
+    процессом, используют все остальные.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0, negative_ttl: float = 15.0,
+                 shared: Optional["SharedLookupStore"] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                  negative_ttl: Optional[float] = None, shared: Optional["SharedLookupStore"] = None) -> None:
+        """Изменяет параметры кэша (например, после загрузки .env)"""
+        with self._lock:
+            if shared is not None:
+                self.shared = shared
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            if negative_ttl is not None:
+                self.negative_ttl = negative_ttl
+            self._evict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Возвращает свежую запись или None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.is_fresh():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry
+            if self.shared is None:
+                self.misses += 1
+                return None
+
+        entry = self.shared.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            self._evict()
+            self.hits += 1
+            return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Возвращает запись, даже устаревшую, не влияя на статистику"""
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value: Any, negative: bool = False) -> CacheEntry:
+        entry = CacheEntry(value=value, ttl=self.negative_ttl if negative else self.ttl)
+        self._put(key, entry)
+        return entry
+
+    def set_error(self, key: str, error: BaseException) -> CacheEntry:
+        entry = CacheEntry(error=error, ttl=self.negative_ttl)
+        self._put(key, entry)
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _put(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            self._evict()
+        if self.shared is not None:
+            self.shared.set(key, entry)
+
+    def _evict(self) -> None:
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class SharedLookupStore:
+    """
+    Кэш ответов серверов в файле SQLite, общий для нескольких процессов.
+
+    Хранит только свежие записи: время жизни переводится из time.monotonic()
+    в time.time(), чтобы его понимали другие процессы. Данные сохраняются
+    в JSON, исключения - по имени класса. Ошибки SQLite не прерывают запрос
+    к серверу: запись просто считается отсутствующей.
+    """
+    ERRORS = {cls.__name__: cls for cls in (GetServerInfoError, ServerTimeoutError, UpstreamBusyError,
+                                            ConnectionError)}
+
+    def __init__(self, path: str = "lookup_cache.sqlite", busy_timeout: float = 5.0, purge_interval: float = 60.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.purge_interval = purge_interval
+        self._local = threading.local()  # у каждого потока своё соединение
+        self._next_purge = 0.0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS lookup_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, error TEXT, created REAL NOT NULL, expires REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Свежая запись или None"""
+        try:
+            row = self._connection().execute(
+                "SELECT value, error, created, expires FROM lookup_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as ex:
+            logger.warning(f"Shared cache read failed: {ex}")
+            return None
+        now = time.time()
+        if row is None or row[3] <= now:
+            return None
+
+        value, error, created, expires = row
+        if error is not None:
+            name, args = json.loads(error)
+            entry = CacheEntry(error=self.ERRORS.get(name, GetServerInfoError)(*args))
+        else:
+            entry = CacheEntry(value=json.loads(value))
+        monotonic = time.monotonic()
+        entry.created = monotonic - (now - created)
+        entry.expires = monotonic + (expires - now)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        now = time.time()
+        created = now - entry.age
+        expires = created + (entry.expires - entry.created)
+        if entry.error is not None:
+            value, error = None, json.dumps([type(entry.error).__name__, [str(arg) for arg in entry.error.args]])
+        else:
+            value, error = json.dumps(entry.value, ensure_ascii=False), None
+        try:
+            connection = self._connection()
+            connection.execute("INSERT OR REPLACE INTO lookup_cache (key, value, error, created, expires) "
+                               "VALUES (?, ?, ?, ?, ?)", (key, value, error, created, expires))
+            if now >= self._next_purge:
+                self._next_purge = now + self.purge_interval
+                connection.execute("DELETE FROM lookup_cache WHERE expires < ?", (now,))
+        except sqlite3.Error as ex:
+            logger.warning(f"Shared cache write failed: {ex}")
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM lookup_cache")
+
+
+class RenderCache:
+    """
+    LRU-кэш текстов, сформированных по снимку данных из LookupCache.
+
+    Запись привязана к самому объекту данных, а не к его содержимому: пока
+    в LookupCache лежит тот же снимок, все обработчики получают один и тот
+    же готовый текст, а новый ответ сервера даёт новую запись. Кэш держит
+    ссылку на снимок, поэтому id() не может быть переиспользован.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()  # (ключ, id снимка) -> (снимок, текст)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, snapshot: Any) -> Optional[str]:
+        with self._lock:
+            item = self._data.get((key, id(snapshot)))
+            if item is None or item[0] is not snapshot:
+                self.misses += 1
+                return None
+            self._data.move_to_end((key, id(snapshot)))
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, snapshot: Any, text: str) -> str:
+        with self._lock:
+            self._data[(key, id(snapshot))] = (snapshot, text)
+            self._data.move_to_end((key, id(snapshot)))
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return text
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Call:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом.
+
+    Первый поток выполняет функцию, остальные ждут его и получают
+    тот же результат или то же исключение.
+    """
+
+    def __init__(self):
+        self.shared = 0  # сколько вызовов получили чужой результат
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise type(call.error)(*call.error.args)
+            return call.value
+
+        try:
+            call.value = fn(*args, **kwargs)
+            return call.value
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        """Количество выполняющихся сейчас вызовов"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Аналог SingleFlight для корутин одного event loop"""
+
+    def __init__(self):
+        self.shared = 0
+        self._calls: dict = {}
+
+    async def do(self, key: str, fn, *args, **kwargs) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                raise type(exc)(*exc.args)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # помечаем исключение как полученное, даже если ждущих нет
+            raise
+        finally:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,13 @@
+class GetServerInfoError(Exception):
+    """Базовое пользовательское исключение"""
+    pass
+
+
+class ServerTimeoutError(GetServerInfoError):
+    """Сервер или API не ответили вовремя"""
+    pass
+
+
+class UpstreamBusyError(GetServerInfoError):
+    """Слишком много одновременных запросов к серверам, запрос не дождался очереди"""
+    pass
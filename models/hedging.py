@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+
+class BackendStats:
+    """Статистика задержек и ошибок одного способа получения данных"""
+
+    def __init__(self, window: int = 200):
+        self.latencies: deque = deque(maxlen=window)
+        self.results: deque = deque(maxlen=window)  # True - успех, False - ошибка
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.latencies.append(latency)
+            self.results.append(ok)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Перцентиль задержки успешных запросов или None, если данных мало"""
+        with self._lock:
+            if len(self.latencies) < 10:
+                return None
+            values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.results:
+                return 0.0
+            return self.results.count(False) / len(self.results)
+
+    def as_dict(self) -> dict:
+        return {"p50": self.percentile(0.5), "p95": self.percentile(0.95),
+                "error_rate": self.error_rate(), "samples": len(self.results)}
+
+
+class HedgedLookup:
+    """
+    Опрашивает несколько источников с "подстраховкой" (hedged requests).
+
+    Запрос уходит в самый здоровый источник; если он не ответил за время,
+    равное заданному перцентилю его задержки, запрос дублируется в следующий.
+    Побеждает первый ответ с работающим сервером, остальные отменяются
+    (уже выполняющиеся запросы дорабатывают в фоне, их результат отбрасывается).
+    Ответ "сервер выключен" принимается, только если другие источники
+    тоже не дали лучшего результата.
+
+    Для асинхронного режима используется acall() с async_backends.
+    """
+
+    def __init__(self, backends: Dict[str, Callable[[str], Dict[str, Any]]], async_backends: Optional[dict] = None,
+                 percentile: float = 0.95, min_delay: float = 0.1, max_delay: float = 3.0,
+                 default_delay: float = 1.0, max_workers: int = 32):
+        self.backends = backends
+        self.async_backends = async_backends or {}
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.stats = {name: BackendStats() for name in backends}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def hedge_delay(self, name: str) -> float:
+        """Сколько ждать ответа источника, прежде чем дублировать запрос"""
+        delay = self.stats[name].percentile(self.percentile)
+        if delay is None:
+            delay = self.default_delay
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def ordered_backends(self) -> List[str]:
+        """Источники от самого здорового к наименее здоровому"""
+        def score(name: str) -> float:
+            stats = self.stats[name]
+            p50 = stats.percentile(0.5)
+            latency = self.default_delay if p50 is None else p50
+            # частые ошибки отодвигают источник в конец очереди
+            return latency * (1 + 10 * stats.error_rate())
+
+        return sorted(self.backends, key=score)
+
+    def _run(self, name: str, address: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            data = self.backends[name](address)
+        except Exception:
+            self.stats[name].record(time.perf_counter() - started, False)
+            raise
+        self.stats[name].record(time.perf_counter() - started, True)
+        return data
+
+    async def _arun(self, name: str, address: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            data = await self.async_backends[name](address)
+        except Exception:
+            self.stats[name].record(time.perf_counter() - started, False)
+            raise
+        self.stats[name].record(time.perf_counter() - started, True)
+        return data
+
+    @staticmethod
+    def _collect(done, outcome: dict) -> Optional[Dict[str, Any]]:
+        """Разбирает завершившиеся запросы; возвращает ответ-победитель, если он есть"""
+        for future in done:
+            try:
+                data = future.result()
+            except Exception as exc:
+                outcome.setdefault("error", exc)
+                continue
+            if data["ping"] and data["is_online"]:
+                return data
+            outcome.setdefault("fallback", data)
+        return None
+
+    @staticmethod
+    def _outcome_result(outcome: dict) -> Dict[str, Any]:
+        if "fallback" in outcome:
+            return outcome["fallback"]
+        raise outcome["error"]
+
+    def __call__(self, address: str) -> Dict[str, Any]:
+        queue = self.ordered_backends()
+        pending: Dict[Future, str] = {}
+        outcome: dict = {}
+
+        try:
+            while queue or pending:
+                timeout = None
+                if queue:
+                    name = queue.pop(0)
+                    pending[self._executor.submit(self._run, name, address)] = name
+                    if queue:
+                        timeout = self.hedge_delay(name)
+
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.pop(future)
+                winner = self._collect(done, outcome)
+                if winner is not None:
+                    return winner
+        finally:
+            for future in pending:
+                future.cancel()
+
+        return self._outcome_result(outcome)
+
+    async def acall(self, address: str) -> Dict[str, Any]:
+        """Асинхронная версия: проигравшие запросы действительно отменяются"""
+        queue = [name for name in self.ordered_backends() if name in self.async_backends]
+        pending: Dict[asyncio.Task, str] = {}
+        outcome: dict = {}
+
+        try:
+            while queue or pending:
+                timeout = None
+                if queue:
+                    name = queue.pop(0)
+                    pending[asyncio.ensure_future(self._arun(name, address))] = name
+                    if queue:
+                        timeout = self.hedge_delay(name)
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.pop(task)
+                winner = self._collect(done, outcome)
+                if winner is not None:
+                    return winner
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return self._outcome_result(outcome)
+
+    def stats_dict(self) -> dict:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
@@ -0,0 +1,142 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp нужен только для асинхронного режима
+    aiohttp = None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(retry_after: Optional[str], attempt: int, backoff: float, max_backoff: float) -> Optional[float]:
+    """Задержка перед повтором или None, если сервер просит ждать слишком долго"""
+    delay = parse_retry_after(retry_after)
+    if delay is not None:
+        return delay if delay <= max_backoff else None
+    # "full jitter": случайная задержка от 0 до экспоненциальной границы
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+class PooledHttpClient:
+    """
+    HTTP-клиент с общим пулом keep-alive соединений.
+
+    Каждый поток получает свою requests.Session (чтобы не делить cookies
+    и заголовки), но все сессии используют один HTTPAdapter, поэтому
+    TCP/TLS-соединения переиспользуются между потоками.
+    Ответы 429 и 5xx повторяются с экспоненциальной задержкой со случайным
+    разбросом; заголовок Retry-After имеет приоритет.
+    """
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, pool_size: int = 32, connect_timeout: float = 3.05, read_timeout: float = 15,
+                 retries: int = 2, backoff: float = 0.5, max_backoff: float = 10.0,
+                 user_agent: str = "MinecraftServersInfoBot"):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.user_agent = user_agent
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """Сессия текущего потока"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            session.headers["User-Agent"] = self.user_agent
+            self._local.session = session
+        return session
+
+    def get(self, url: str) -> requests.Response:
+        """GET-запрос с повторами при 429/5xx"""
+        attempt = 0
+        while True:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code not in self.RETRY_STATUSES or attempt >= self.retries:
+                return response
+
+            delay = retry_delay(response.headers.get("Retry-After"), attempt, self.backoff, self.max_backoff)
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self._adapter.close()
+
+
+class AsyncPooledHttpClient:
+    """
+    Асинхронный аналог PooledHttpClient на aiohttp.
+
+    Сессия создаётся при первом запросе внутри работающего event loop.
+    """
+    RETRY_STATUSES = PooledHttpClient.RETRY_STATUSES
+
+    def __init__(self, pool_size: int = 100, connect_timeout: float = 3.05, read_timeout: float = 15,
+                 retries: int = 2, backoff: float = 0.5, max_backoff: float = 10.0,
+                 user_agent: str = "MinecraftServersInfoBot"):
+        if aiohttp is None:
+            raise RuntimeError("Для асинхронного режима установите aiohttp")
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.user_agent = user_agent
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                timeout=self.timeout,
+                headers={"User-Agent": self.user_agent},
+            )
+        return self._session
+
+    async def get_json(self, url: str) -> Any:
+        """GET-запрос с повторами при 429/5xx, возвращает разобранный JSON"""
+        attempt = 0
+        while True:
+            async with self.session.get(url) as response:
+                if response.status in self.RETRY_STATUSES and attempt < self.retries:
+                    delay = retry_delay(response.headers.get("Retry-After"), attempt, self.backoff, self.max_backoff)
+                else:
+                    delay = None
+                if delay is None:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,201 @@
+"""
+Единая настройка логирования.
+
+Логгеры пишут записи в очередь (QueueHandler), а запись в файлы и консоль
+выполняет один фоновый поток пачками, поэтому потоки обработчиков бота
+не ждут диска.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import List, Optional
+
+APP_LOGGER = 'my_app'
+MSGS_LOGGER = 'my_app.msgs'
+
+_writer: Optional["BatchingLogWriter"] = None
+_setup_lock = threading.Lock()
+
+
+class SizeTimedRotatingFileHandler(RotatingFileHandler):
+    """
+    Файловый обработчик с ротацией по размеру и по времени.
+
+    Сам не сбрасывает буфер после каждой записи - это делает
+    BatchingLogWriter после обработки пачки записей.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 interval: float = 24 * 60 * 60, encoding: str = "utf-8"):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.interval = interval
+        started = os.path.getmtime(filename) if os.path.exists(filename) else time.time()
+        self.rollover_at = started + interval
+
+    def shouldRollover(self, record) -> bool:
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+    def emit(self, record) -> None:
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """Вывод в консоль без сброса буфера после каждой записи"""
+
+    def emit(self, record) -> None:
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога в виде одной JSON-строки"""
+
+    def format(self, record) -> str:
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class BatchingLogWriter:
+    """Фоновый поток: забирает записи из очереди пачками и передаёт обработчикам"""
+
+    def __init__(self, log_queue: "queue.SimpleQueue", handlers: List[logging.Handler], batch_size: int = 256):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Записывает оставшиеся записи и закрывает обработчики"""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        for handler in self.handlers:
+            handler.close()
+
+    def _handle(self, record: logging.LogRecord) -> None:
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for record in batch:
+                if record is None:
+                    stop = True
+                else:
+                    self._handle(record)
+            for handler in self.handlers:
+                handler.flush()
+            if stop:
+                return
+
+
+def setup_logging(log_file: str = "app.log", msgs_file: str = "msgs.txt", json_format: bool = False,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  rotate_interval: float = 24 * 60 * 60, console: bool = True) -> logging.Logger:
+    """
+    Настраивает логгеры my_app (app.log + консоль) и my_app.msgs (msgs.txt + консоль).
+    console=False отключает вывод в консоль. Повторные вызовы ничего не меняют.
+    """
+    global _writer
+    app_logger = logging.getLogger(APP_LOGGER)
+    with _setup_lock:
+        if _writer is not None:
+            return app_logger
+
+        if json_format:
+            app_formatter = msgs_formatter = JsonFormatter()
+        else:
+            app_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            msgs_formatter = logging.Formatter('[%(asctime)s] %(message)s', datefmt="%H:%M.%S %d.%m.%Y")
+
+        def is_msg(record):
+            return record.name == MSGS_LOGGER
+
+        def is_not_msg(record):
+            return record.name != MSGS_LOGGER
+
+        # логгер для фаилов
+        file_handler = SizeTimedRotatingFileHandler(log_file, max_bytes, backup_count, rotate_interval)
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(app_formatter)
+        file_handler.addFilter(is_not_msg)
+        # логгер для консоли
+        console_handler = BufferedStreamHandler()
+        console_handler.setLevel(logging.DEBUG)
+        console_handler.setFormatter(app_formatter)
+        console_handler.addFilter(is_not_msg)
+        # входящие сообщения пользователей
+        msgs_handler = SizeTimedRotatingFileHandler(msgs_file, max_bytes, backup_count, rotate_interval)
+        msgs_handler.setFormatter(msgs_formatter)
+        msgs_handler.addFilter(is_msg)
+        msgs_console_handler = BufferedStreamHandler(sys.stdout)
+        msgs_console_handler.setFormatter(msgs_formatter)
+        msgs_console_handler.addFilter(is_msg)
+
+        log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        handlers = [file_handler, msgs_handler]
+        if console:
+            handlers += [console_handler, msgs_console_handler]
+        _writer = BatchingLogWriter(log_queue, handlers)
+        _writer.start()
+        atexit.register(shutdown_logging)
+
+        queue_handler = QueueHandler(log_queue)
+        app_logger.setLevel(logging.DEBUG)
+        app_logger.addHandler(queue_handler)
+        msgs_logger = logging.getLogger(MSGS_LOGGER)
+        msgs_logger.setLevel(logging.INFO)
+        # записи my_app.msgs идут в очередь через родительский логгер my_app
+
+    return app_logger
+
+
+def shutdown_logging() -> None:
+    """Дописывает очередь логов на диск"""
+    global _writer
+    with _setup_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
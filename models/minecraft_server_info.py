@@ -1,33 +1,66 @@
+import asyncio
 import json
+import threading
+import time
 import requests
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 import logging
 
-logger = logging.getLogger('my_app')
-logger.setLevel(logging.DEBUG)
+from concurrent.futures import ThreadPoolExecutor
+
+from models.cache import AsyncSingleFlight, CacheEntry, LookupCache, SingleFlight
+from models.errors import GetServerInfoError, ServerTimeoutError, UpstreamBusyError
+from models.hedging import HedgedLookup
+from models.metrics import lookup_result, lookup_seconds, rate_limited
+from models.prefetch import RequestFrequency
+from models.ratelimit import FairSemaphore
+from models.http_client import AsyncPooledHttpClient, PooledHttpClient, aiohttp
+from models.slp import DEFAULT_PORT, async_get_slp_server_info, get_slp_server_info
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('my_app')
 
-file_handler = logging.FileHandler('app.log')
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(formatter)
+STATUS_API_URL = "https://api.mcsrvstat.us/3/"
 
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# общий HTTP-клиент с пулом соединений к API
+http_client = PooledHttpClient()
+_http_options: dict = {}
+# асинхронный клиент создаётся при первом запросе в асинхронном режиме
+async_http_client: Optional[AsyncPooledHttpClient] = None
+# кэш результатов запросов, общий для всех потоков бота
+lookup_cache = LookupCache()
+# объединение одновременных запросов к одному серверу
+lookup_flight = SingleFlight()
+async_lookup_flight = AsyncSingleFlight()
+# частота запросов по адресам (для фонового обновления популярных серверов)
+request_frequency = RequestFrequency()
+# фоновые обновления устаревших данных
+refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="refresh")
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+# ограничение одновременных запросов к серверам и API: лишние ждут в очереди не дольше upstream_queue_timeout
+upstream_limiter = FairSemaphore(32)
+upstream_queue_timeout = 10.0
+_async_upstream_limiter: Optional[asyncio.Semaphore] = None
+# получатели новых данных о серверах (например, запись истории)
+_lookup_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
 
 
-class GetServerInfoError(Exception):
-    """Базовое пользовательское исключение"""
-    pass
+def normalize_address(address: str) -> str:
+    """Приводит адрес сервера к единому виду (используется как ключ кэша)"""
+    address = address.strip().lower().rstrip(".")
+    if address.endswith(f":{DEFAULT_PORT}"):
+        address = address[:-len(f":{DEFAULT_PORT}")]
+    return address
 
 
 def get_mc_server_info(address: str) -> Dict[str, Any]:
     """
-    Получает информацию о Minecraft-сервере через API mcsrvstat.us.
+    Получает информацию о Minecraft-сервере с учётом кэша.
+
+    Ответы (в том числе ошибки и выключенные сервера) кэшируются
+    по нормализованному адресу в lookup_cache, а одновременные запросы
+    к одному адресу выполняются одним обращением к API.
 
     Args:
         address (str): IP или домен сервера (с портом, если не стандартный).
@@ -39,15 +72,209 @@ def get_mc_server_info(address: str) -> Dict[str, Any]:
         ValueError: Некорректные данные в ответе.
         GetServerInfoError: ошибка сети или API
     """
+    key = normalize_address(address)
+    request_frequency.record(key)
+    return _get_mc_server_info(key)
+
+
+def _get_mc_server_info(key: str) -> Dict[str, Any]:
+    entry = lookup_cache.get(key)
+    if entry is not None:
+        return entry.result()
+    return lookup_flight.do(key, _lookup_and_cache, key)
+
+
+def prefetch_mc_server_info(address: str) -> Dict[str, Any]:
+    """Запрашивает данные сервера, даже если в кэше есть свежие, и обновляет кэш"""
+    key = normalize_address(address)
+    return lookup_flight.do(key, _fetch_and_cache, key)
+
+
+def peek_mc_server_info(address: str) -> Optional[CacheEntry]:
+    """Последний известный ответ по серверу (в том числе устаревший) или None"""
+    return lookup_cache.peek(normalize_address(address))
+
+
+def refresh_mc_server_info(address: str) -> None:
+    """Запускает обновление данных сервера в фоне, не дожидаясь результата"""
+    key = normalize_address(address)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            _get_mc_server_info(key)
+        except Exception:
+            pass  # ошибка уже сохранена в кэше
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    refresh_executor.submit(refresh)
+
+
+def _lookup_and_cache(key: str) -> Dict[str, Any]:
+    """Запрашивает данные у API и сохраняет результат в кэш"""
+    # пока мы ждали своей очереди, результат мог появиться в кэше
+    entry = lookup_cache.peek(key)
+    if entry is not None and entry.is_fresh():
+        return entry.result()
+    return _fetch_and_cache(key)
+
+
+def _fetch_and_cache(key: str) -> Dict[str, Any]:
+    if not upstream_limiter.acquire(timeout=upstream_queue_timeout):
+        rate_limited.inc(scope="upstream")
+        raise UpstreamBusyError("Слишком много запросов к серверам, попробуйте позже")
     try:
-        response = requests.get(
-            f"https://api.mcsrvstat.us/3/{address}",
-            timeout=15
-        )
+        with lookup_seconds.time(backend=lookup_backend_name, result="error") as timer:
+            try:
+                data = lookup_backend(key)
+            except (GetServerInfoError, ConnectionError) as exc:
+                timer.labels["result"] = lookup_result(exc)
+                lookup_cache.set_error(key, exc)
+                raise
+            timer.labels["result"] = lookup_result(None, data)
+    finally:
+        upstream_limiter.release()
+
+    lookup_cache.set(key, data, negative=not (data["ping"] and data["is_online"]))
+    _notify_lookup(key, data)
+    return data
+
+
+def configure_http_client(**options) -> None:
+    """Пересоздаёт HTTP-клиент с новыми параметрами (см. PooledHttpClient)"""
+    global http_client, _http_options
+    old, http_client = http_client, PooledHttpClient(**options)
+    _http_options = options
+    old.close()
+
+
+def add_lookup_listener(listener: Callable[[str, Dict[str, Any]], None]) -> None:
+    """Вызывает listener(адрес, данные) после каждого успешного запроса к серверу"""
+    _lookup_listeners.append(listener)
+
+
+def _notify_lookup(key: str, data: Dict[str, Any]) -> None:
+    for listener in _lookup_listeners:
+        try:
+            listener(key, data)
+        except Exception as ex:
+            logger.error(f"Error in lookup listener: {ex}")
+
+
+def configure_upstream_limit(max_concurrent: int, queue_timeout: float) -> None:
+    """
+    Ограничивает число одновременных запросов к серверам (0 - без ограничения).
+    Запросы сверх лимита ждут в очереди queue_timeout секунд, затем получают UpstreamBusyError.
+    """
+    global upstream_limiter, upstream_queue_timeout, _async_upstream_limiter
+    upstream_limiter = FairSemaphore(max_concurrent)
+    upstream_queue_timeout = queue_timeout
+    _async_upstream_limiter = None
+
+
+def _get_async_upstream_limiter() -> Optional[asyncio.Semaphore]:
+    """Асинхронный аналог upstream_limiter (в асинхронном режиме все запросы идут из одного event loop)"""
+    global _async_upstream_limiter
+    if upstream_limiter.limit <= 0:
+        return None
+    if _async_upstream_limiter is None:
+        _async_upstream_limiter = asyncio.Semaphore(upstream_limiter.limit)
+    return _async_upstream_limiter
+
+
+def get_async_http_client() -> AsyncPooledHttpClient:
+    """Асинхронный HTTP-клиент с теми же параметрами, что и http_client"""
+    global async_http_client
+    if async_http_client is None:
+        async_http_client = AsyncPooledHttpClient(**_http_options)
+    return async_http_client
+
+
+async def async_get_mc_server_info(address: str) -> Dict[str, Any]:
+    """Асинхронная версия get_mc_server_info (использует тот же кэш)"""
+    key = normalize_address(address)
+    request_frequency.record(key)
+    entry = lookup_cache.get(key)
+    if entry is not None:
+        return entry.result()
+    return await async_lookup_flight.do(key, _async_lookup_and_cache, key)
+
+
+async def _async_lookup_and_cache(key: str) -> Dict[str, Any]:
+    entry = lookup_cache.peek(key)
+    if entry is not None and entry.is_fresh():
+        return entry.result()
+
+    limiter = _get_async_upstream_limiter()
+    if limiter is not None:
+        try:
+            await asyncio.wait_for(limiter.acquire(), upstream_queue_timeout)
+        except asyncio.TimeoutError:
+            rate_limited.inc(scope="upstream")
+            raise UpstreamBusyError("Слишком много запросов к серверам, попробуйте позже")
+    try:
+        with lookup_seconds.time(backend=lookup_backend_name, result="error") as timer:
+            try:
+                data = await async_lookup_backend(key)
+            except (GetServerInfoError, ConnectionError) as exc:
+                timer.labels["result"] = lookup_result(exc)
+                lookup_cache.set_error(key, exc)
+                raise
+            timer.labels["result"] = lookup_result(None, data)
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+    lookup_cache.set(key, data, negative=not (data["ping"] and data["is_online"]))
+    _notify_lookup(key, data)
+    return data
+
+
+async def _async_fetch_mc_server_info(address: str) -> Dict[str, Any]:
+    """Асинхронная версия _fetch_mc_server_info"""
+    try:
+        started = time.perf_counter()
+        data = await get_async_http_client().get_json(f"{STATUS_API_URL}{address}")
+        latency = time.perf_counter() - started
+    except asyncio.TimeoutError:
+        raise ServerTimeoutError(f'Превышено время ожидания ответа от сервера "{address}"')
+    except aiohttp.ClientError as exc:
+        raise ConnectionError(f"Ошибка API: {str(exc)}") from exc
+    except json.JSONDecodeError as exc:
+        logger.error("Invalid JSON response")
+        raise ValueError("Некорректный ответ API") from exc
+
+    return _parse_api_response(data, latency)
+
+
+def _fetch_mc_server_info(address: str) -> Dict[str, Any]:
+    """
+    Получает информацию о Minecraft-сервере через API mcsrvstat.us.
+
+    Args:
+        address (str): IP или домен сервера (с портом, если не стандартный).
+
+    Returns:
+        Dict[str, Any]: Словарь с данными сервера (дополнительно latency - время
+            ответа API в мс: API не сообщает задержку до самого сервера).
+
+    Raises:
+        ValueError: Некорректные данные в ответе.
+        GetServerInfoError: ошибка сети или API
+    """
+    try:
+        started = time.perf_counter()
+        response = http_client.get(f"{STATUS_API_URL}{address}")
+        latency = time.perf_counter() - started
         response.raise_for_status()
         data = response.json()
     except requests.exceptions.Timeout:
-        raise GetServerInfoError(f'Превышено время ожидания ответа от сервера "{address}"')
+        raise ServerTimeoutError(f'Превышено время ожидания ответа от сервера "{address}"')
 
     except requests.exceptions.RequestException as exc:
         # logger.error("API request error: %s", str(exc))
@@ -59,6 +286,11 @@ def get_mc_server_info(address: str) -> Dict[str, Any]:
     except ConnectionError:
         raise GetServerInfoError("Ошибка сети на сервере или API")
 
+    return _parse_api_response(data, latency)
+
+
+def _parse_api_response(data: Dict[str, Any], latency: float) -> Dict[str, Any]:
+    """Преобразует ответ mcsrvstat.us в словарь с данными сервера"""
     players_data = data.get("players", {})
 
     return {
@@ -69,5 +301,49 @@ def get_mc_server_info(address: str) -> Dict[str, Any]:
         "max_players": players_data.get("max", 0),
         "is_online": data.get("online", False),
         "address": f"{data.get('ip', '')}:{data.get('port', '')}",
-        "players_list": players_data.get("list", [])
+        "players_list": players_data.get("list", []),
+        "latency": round(latency * 1000),
     }
+
+
+# доступные способы получения информации о сервере
+BACKENDS = {
+    "api": _fetch_mc_server_info,  # через API mcsrvstat.us
+    "slp": get_slp_server_info,  # напрямую по протоколу Server List Ping
+}
+ASYNC_BACKENDS = {
+    "api": _async_fetch_mc_server_info,
+    "slp": async_get_slp_server_info,
+}
+lookup_backend: Callable[[str], Dict[str, Any]] = _fetch_mc_server_info
+async_lookup_backend: Callable[[str], Awaitable[Dict[str, Any]]] = _async_fetch_mc_server_info
+lookup_backend_name = "api"  # для метрик
+
+
+def set_lookup_backend(names: str, **hedge_options) -> None:
+    """
+    Выбирает способ получения информации о серверах.
+
+    Args:
+        names (str): имя источника из BACKENDS или несколько имён через запятую.
+            Несколько источников опрашиваются через HedgedLookup.
+        **hedge_options: параметры HedgedLookup (percentile, min_delay, ...).
+    """
+    global lookup_backend, async_lookup_backend, lookup_backend_name
+    selected = [name.strip() for name in names.split(",") if name.strip()]
+    for name in selected:
+        if name not in BACKENDS:
+            raise ValueError(f"Неизвестный способ получения данных: {name}")
+    if not selected:
+        raise ValueError("Не указан способ получения данных")
+
+    if len(selected) == 1:
+        lookup_backend = BACKENDS[selected[0]]
+        async_lookup_backend = ASYNC_BACKENDS[selected[0]]
+    else:
+        hedged = HedgedLookup({name: BACKENDS[name] for name in selected},
+                              async_backends={name: ASYNC_BACKENDS[name] for name in selected},
+                              **hedge_options)
+        lookup_backend = hedged
+        async_lookup_backend = hedged.acall
+    lookup_backend_name = ",".join(selected)
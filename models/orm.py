@@ -1,9 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import (bindparam, cast, create_engine, event, func, literal, make_url, select, Column, DateTime,
+                        ForeignKey, Index, Integer, String, UniqueConstraint)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.exc import IntegrityError, NoResultFound
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from contextlib import contextmanager
 from datetime import datetime
+from models.cache import LookupCache
+from models.metrics import db_seconds
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import atexit
 import json
+import threading
+import time
 
 Base = declarative_base()
 
@@ -12,53 +22,428 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     first_use = Column(DateTime, default=datetime.now)
     requests_count = Column(Integer, default=0)
+    # устаревший формат избранных (JSON); данные переносятся в таблицу fav_servers
     fav_servers = Column(String, default="{}")
 
-class MySession:
-    def __init__(self, path='sqlite:///data.sqlite'):
-        engine = create_engine(path)
+
+class FavServer(Base):
+    """Избранный сервер пользователя"""
+    __tablename__ = 'fav_servers'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    name = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # уникальный индекс также используется для выборки избранных пользователя
+        UniqueConstraint('user_id', 'name', name='uq_fav_servers_user_name'),
+        Index('ix_fav_servers_address', 'address'),
+    )
+
+
+class Server(Base):
+    """Сервер, для которого хранится история состояния"""
+    __tablename__ = 'servers'
+    id = Column(Integer, primary_key=True)
+    address = Column(String, nullable=False, unique=True)
+
+
+class ServerVersion(Base):
+    """Справочник версий серверов (в истории хранится только id)"""
+    __tablename__ = 'server_versions'
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+class ServerStatus(Base):
+    """
+    История состояния серверов.
+
+    resolution - длительность интервала в секундах: 0 для отдельных замеров,
+    3600 и 86400 для часовых и суточных агрегатов, в которые со временем
+    сворачиваются старые замеры. ts - начало интервала (unix-время).
+    Первичный ключ (server_id, resolution, ts) служит индексом для выборки
+    истории сервера за период; в SQLite таблица хранится без rowid,
+    упорядоченной по этому ключу.
+    """
+    __tablename__ = 'server_status'
+    server_id = Column(Integer, ForeignKey('servers.id'), primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    ts = Column(Integer, primary_key=True)
+    samples = Column(Integer, nullable=False, default=1)  # количество замеров в интервале
+    online = Column(Integer, nullable=False)  # из них сервер был в сети
+    players = Column(Integer, nullable=False)  # среднее количество игроков
+    players_peak = Column(Integer, nullable=False)
+    max_players = Column(Integer, nullable=False)
+    ping_ms = Column(Integer)
+    version_id = Column(Integer, ForeignKey('server_versions.id'))
+
+    __table_args__ = (
+        # для сворачивания старых замеров в агрегаты
+        Index('ix_server_status_resolution_ts', 'resolution', 'ts'),
+        {"sqlite_with_rowid": False},
+    )
+
+
+# длительность интервалов истории: отдельные замеры, часовые и суточные агрегаты
+HISTORY_RESOLUTIONS = (0, 3600, 86400)
+
+
+def _insert_ignore(engine, table):
+    """INSERT, пропускающий строки с уже существующим ключом"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    return table.insert().prefix_with("OR IGNORE", dialect="sqlite").prefix_with("IGNORE", dialect="mysql")
+
+
+def create_db_engine(path: str, pool_size: int = 10, busy_timeout: float = 5.0):
+    """
+    Создаёт движок базы данных с пулом соединений.
+
+    Для SQLite включается режим WAL (чтение не блокируется записью) и
+    ожидание снятия блокировки вместо мгновенной ошибки "database is locked".
+    Для серверных баз (PostgreSQL, MySQL) используется обычный QueuePool
+    с проверкой соединений перед выдачей.
+    """
+    url = make_url(path)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(path, pool_size=pool_size, max_overflow=pool_size,
+                             pool_pre_ping=True, pool_recycle=3600)
+
+    if url.database in (None, "", ":memory:"):
+        # база в памяти существует только внутри одного соединения
+        return create_engine(path, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    engine = create_engine(path, connect_args={"check_same_thread": False, "timeout": busy_timeout},
+                           poolclass=QueuePool, pool_size=pool_size, max_overflow=pool_size)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        cursor.close()
+
+    return engine
+
+
+def create_schema(path: str) -> None:
+    """
+    Создаёт таблицы и переносит данные из старого формата заранее, например
+    до запуска нескольких процессов с одной базой, чтобы они не делали это
+    одновременно (такие процессы создают MySession с init_schema=False).
+    """
+    engine = create_db_engine(path, pool_size=1)
+    try:
         Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as session:
+            migrate_fav_servers(session)
+    finally:
+        engine.dispose()
+
+
+def migrate_fav_servers(session) -> None:
+    """Переносит избранные сервера из JSON-колонки users.fav_servers в таблицу fav_servers"""
+    users = (session.query(User)
+             .filter(User.fav_servers.isnot(None), User.fav_servers.notin_(["", "{}"]))
+             .all())
+    for user in users:
+        try:
+            fav_servers = json.loads(user.fav_servers)
+        except ValueError:
+            print(f"Некорректные избранные сервера у пользователя id={user.id}")
+            continue
+        existing = MySession._load_fav_servers(session, user.id)
+        for name, address in fav_servers.items():
+            if name not in existing:
+                session.add(FavServer(user_id=user.id, name=name, address=address))
+        user.fav_servers = "{}"
+    if users:
+        session.commit()
+        print(f"Избранные сервера перенесены в отдельную таблицу: {len(users)} пользователей")
+
+
+class MySession:
+    """
+    Доступ к базе данных из нескольких потоков.
+
+    Каждый поток (или задача в пуле AsyncMySession) получает свою сессию
+    через scoped_session; сессия закрывается после каждой операции
+    и возвращает соединение в пул.
+
+    Пользователи и их избранные сервера кэшируются в памяти (user_cache),
+    изменения записываются в базу и сразу в кэш.
+
+    Счётчики запросов копятся в памяти и записываются одной транзакцией
+    раз в flush_interval секунд, при накоплении flush_threshold запросов
+    и при закрытии сессии. Так же записываются замеры состояния серверов
+    (record_server_status) - не чаще одного в history_interval секунд на сервер.
+    Раз в history_compact_interval секунд старые замеры сворачиваются
+    в часовые, а затем в суточные агрегаты; history_retention - сколько дней
+    хранятся замеры, часовые и суточные агрегаты. history_compact_interval=0 -
+    не сворачивать (с одной базой работают несколько процессов, и это делает один из них).
+
+    init_schema=False - не создавать таблицы и не переносить старые данные:
+    это уже сделал create_schema (несколько процессов с одной базой).
+    """
+
+    def __init__(self, path='sqlite:///data.sqlite', pool_size: int = 10, busy_timeout: float = 5.0,
+                 cache_size: int = 10000, cache_ttl: float = 600,
+                 flush_interval: float = 5.0, flush_threshold: int = 100,
+                 history_interval: float = 60, history_retention: tuple = (2, 30, 365),
+                 history_compact_interval: float = 600, init_schema: bool = True):
+        self.engine = create_db_engine(path, pool_size=pool_size, busy_timeout=busy_timeout)
+        if init_schema:
+            Base.metadata.create_all(self.engine)
+
+        self.Session = scoped_session(sessionmaker(bind=self.engine, expire_on_commit=False))
+        if init_schema:
+            self._migrate_fav_servers()
+        # user_id -> (User, избранные сервера)
+        self.user_cache = LookupCache(max_size=cache_size, ttl=cache_ttl)
 
-        Session = sessionmaker(bind=engine)
-        self.session = Session()
+        # user_id -> сколько запросов ещё не записано в базу
+        self._pending_requests: dict[int, int] = {}
+        self._pending_total = 0
+        self._pending_lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        # замеры состояния серверов, ещё не записанные в базу
+        self.history_interval = history_interval
+        self.history_retention = history_retention
+        self.history_compact_interval = history_compact_interval
+        self._history_buffer: list[tuple] = []
+        self._history_last: dict[str, float] = {}  # адрес -> время последнего замера
+        self._history_lock = threading.Lock()
+        self._server_ids: dict[str, int] = {}
+        self._version_ids: dict[str, int] = {}
+        self._next_compact = time.monotonic() + history_compact_interval
+        self._flush_wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="db-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _cache_user(self, user: User, fav_servers: dict) -> None:
+        self.user_cache.set(user.id, (user, fav_servers))
+
+    def _migrate_fav_servers(self):
+        with self._session("migrate_fav_servers") as session:
+            migrate_fav_servers(session)
+
+    @staticmethod
+    def _load_fav_servers(session, user_id: int) -> dict[str, str]:
+        rows = (session.query(FavServer.name, FavServer.address)
+                .filter(FavServer.user_id == user_id)
+                .order_by(FavServer.created_at, FavServer.id))
+        return {name: address for name, address in rows}
+
+    @contextmanager
+    def _session(self, operation: str):
+        """Сессия текущего потока на время одной операции (operation - имя для метрик)"""
+        session = self.Session()
+        try:
+            with db_seconds.time(operation=operation):
+                yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self.Session.remove()
 
     # В методе add_user добавьте проверку существования пользователя
     def add_user(self, user):
-        try:
+        cached = self.user_cache.get(user.id)
+        if cached is not None:
+            return cached.value[0]
+
+        with self._session("add_user") as session:
             # Проверяем, существует ли пользователь
-            existing_user = self.session.query(User).get(user.id)
+            existing_user = session.get(User, user.id)
             if existing_user:
+                self._cache_user(existing_user, self._load_fav_servers(session, existing_user.id))
                 return existing_user  # или обновите данные существующего пользователя
 
-            self.session.add(user)
-            self.session.commit()
+            session.add(user)
+            try:
+                session.commit()
+            except IntegrityError:
+                # пользователя успел добавить другой поток
+                session.rollback()
+                user = session.get(User, user.id)
+            self._cache_user(user, self._load_fav_servers(session, user.id))
             return user
-        except Exception as e:
-            self.session.rollback()
-            raise e
 
     def add_request(self, user_id: int):
-        """Добавляет запрос пользователю"""
-        try:
-            user = self.session.query(User).filter_by(id=user_id).one()
-            user.requests_count += 1
-            self.session.commit()
+        """Добавляет запрос пользователю (запись в базу откладывается)"""
+        with self._pending_lock:
+            self._pending_requests[user_id] = self._pending_requests.get(user_id, 0) + 1
+            self._pending_total += 1
+            if self._pending_total >= self.flush_threshold:
+                self._flush_wakeup.set()
 
-        except NoResultFound:
-            print(f"Пользователь с id={user_id} не найден")
+    def pending_requests(self) -> int:
+        """Сколько запросов ещё не записано в базу"""
+        with self._pending_lock:
+            return self._pending_total
+
+    def flush_requests(self):
+        """Записывает накопленные счётчики запросов одной транзакцией"""
+        with self._pending_lock:
+            pending, self._pending_requests = self._pending_requests, {}
+            self._pending_total = 0
+        if not pending:
+            return
 
+        stmt = (User.__table__.update()
+                .where(User.__table__.c.id == bindparam("user_id"))
+                .values(requests_count=User.__table__.c.requests_count + bindparam("count")))
+        try:
+            with db_seconds.time(operation="flush_requests"), self.engine.begin() as connection:
+                connection.execute(stmt, [{"user_id": user_id, "count": count}
+                                          for user_id, count in pending.items()])
         except Exception as e:
-            self.session.rollback()
             print(f"Ошибка при обновлении: {e}")
+            # возвращаем счётчики, чтобы записать их при следующей попытке
+            with self._pending_lock:
+                for user_id, count in pending.items():
+                    self._pending_requests[user_id] = self._pending_requests.get(user_id, 0) + count
+                    self._pending_total += count
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._flush_wakeup.wait(self.flush_interval)
+            self._flush_wakeup.clear()
+            self.flush_requests()
+            self.flush_history()
+            if self.history_compact_interval > 0 and time.monotonic() >= self._next_compact:
+                self._next_compact = time.monotonic() + self.history_compact_interval
+                try:
+                    self.compact_history()
+                except Exception as e:
+                    print(f"Ошибка при сворачивании истории серверов: {e}")
 
+    def record_server_status(self, address: str, data: dict) -> None:
+        """Сохраняет замер состояния сервера (запись в базу откладывается)"""
+        now = time.time()
+        with self._history_lock:
+            last = self._history_last.get(address)
+            if last is not None and now - last < self.history_interval:
+                return
+            self._history_last[address] = now
+            if len(self._history_last) > 100000:
+                self._history_last = {a: t for a, t in self._history_last.items()
+                                      if now - t < self.history_interval}
+            self._history_buffer.append((address, int(now), data))
+
+    def _lookup_ids(self, cache: dict, table, column, values) -> dict:
+        """id записей справочника (servers, server_versions); отсутствующие создаются"""
+        missing = [value for value in set(values) if value not in cache]
+        if missing:
+            with self.engine.begin() as connection:
+                connection.execute(_insert_ignore(self.engine, table), [{column.name: v} for v in missing])
+                for id_, value in connection.execute(select(table.c.id, column).where(column.in_(missing))):
+                    cache[value] = id_
+        return cache
+
+    def flush_history(self):
+        """Записывает накопленные замеры состояния серверов одной транзакцией"""
+        with self._history_lock:
+            buffer, self._history_buffer = self._history_buffer, []
+        if not buffer:
+            return
+
+        try:
+            with db_seconds.time(operation="flush_history"):
+                servers = Server.__table__
+                versions = ServerVersion.__table__
+                server_ids = self._lookup_ids(self._server_ids, servers, servers.c.address,
+                                              [address for address, _, _ in buffer])
+                version_ids = self._lookup_ids(self._version_ids, versions, versions.c.name,
+                                               [str(data["version"]) for _, _, data in buffer if data.get("version")])
+                rows = []
+                for address, ts, data in buffer:
+                    online = bool(data.get("ping") and data.get("is_online"))
+                    rows.append({
+                        "server_id": server_ids[address], "resolution": 0, "ts": ts, "samples": 1,
+                        "online": int(online),
+                        "players": int(data.get("players") or 0) if online else 0,
+                        "players_peak": int(data.get("players") or 0) if online else 0,
+                        "max_players": int(data.get("max_players") or 0),
+                        "ping_ms": int(data["latency"]) if data.get("latency") is not None else None,
+                        "version_id": version_ids.get(str(data["version"])) if data.get("version") else None,
+                    })
+                with self.engine.begin() as connection:
+                    connection.execute(_insert_ignore(self.engine, ServerStatus.__table__), rows)
+        except Exception as e:
+            # история не критична: замеры не возвращаются в буфер, чтобы он не рос при недоступной базе
+            print(f"Ошибка при записи истории серверов: {e}")
+
+    def compact_history(self, now: float = None):
+        """Сворачивает старые замеры в часовые и суточные агрегаты и удаляет данные старше срока хранения"""
+        now = int(now if now is not None else time.time())
+        t = ServerStatus.__table__
+        raw_days, hourly_days, days = self.history_retention
+        columns = ["server_id", "resolution", "ts", "samples", "online", "players", "players_peak",
+                   "max_players", "ping_ms", "version_id"]
+        with db_seconds.time(operation="compact_history"), self.engine.begin() as connection:
+            for source, target, keep_days in ((0, 3600, raw_days), (3600, 86400, hourly_days)):
+                # сворачиваются только интервалы, целиком попадающие до границы
+                cutoff = now - int(keep_days * 86400)
+                cutoff -= cutoff % target
+                bucket = t.c.ts - t.c.ts % target
+                aggregate = (
+                    select(t.c.server_id, literal(target), bucket, func.sum(t.c.samples), func.sum(t.c.online),
+                           cast(func.sum(t.c.players * t.c.samples) / func.sum(t.c.samples), Integer),
+                           func.max(t.c.players_peak), func.max(t.c.max_players),
+                           cast(func.avg(t.c.ping_ms), Integer), func.max(t.c.version_id))
+                    .where(t.c.resolution == source, t.c.ts < cutoff)
+                    .group_by(t.c.server_id, bucket)
+                )
+                connection.execute(_insert_ignore(self.engine, t).from_select(columns, aggregate))
+                connection.execute(t.delete().where(t.c.resolution == source, t.c.ts < cutoff))
+            connection.execute(t.delete().where(t.c.resolution == HISTORY_RESOLUTIONS[-1],
+                                                t.c.ts < now - int(days * 86400)))
+
+    def get_server_history(self, address: str, since: float) -> list[tuple]:
+        """
+        История сервера с момента since (unix-время), упорядоченная по времени:
+        [(ts, resolution, samples, online, players, players_peak, max_players), ...]
+        """
+        self.flush_history()
+        t = ServerStatus.__table__
+        with self._session("get_server_history") as session:
+            server_id = self._server_ids.get(address)
+            if server_id is None:
+                server_id = session.execute(select(Server.id).where(Server.address == address)).scalar()
+                if server_id is None:
+                    return []
+                self._server_ids[address] = server_id
+            rows = session.execute(
+                select(t.c.ts, t.c.resolution, t.c.samples, t.c.online, t.c.players, t.c.players_peak,
+                       t.c.max_players)
+                .where(t.c.server_id == server_id, t.c.resolution.in_(HISTORY_RESOLUTIONS), t.c.ts >= int(since))
+                .order_by(t.c.ts)
+            )
+            return [tuple(row) for row in rows]
 
     def get_fav_servers(self, user_id: int) -> dict[str, str]:
         """Возвращает избранные сервера пользователя"""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return dict(cached.value[1])  # копия, чтобы изменения вызывающего не попали в кэш
+
         try:
-            user = self.session.query(User).filter_by(id=user_id).one()
-            res = json.loads(user.fav_servers)
+            with self._session("get_fav_servers") as session:
+                user = session.query(User).filter_by(id=user_id).one()
+                res = self._load_fav_servers(session, user_id)
+            self._cache_user(user, res)
 
-            return res
+            return dict(res)
 
         except NoResultFound:
             print(f"Пользователь с id={user_id} не найден")
@@ -69,9 +454,89 @@ class MySession:
     def set_fav_servers(self, user_id: int, fav_servers):
         """Устонавливает избранные сервера пользователя"""
         try:
-            user = self.session.query(User).filter_by(id=user_id).one()
-            user.fav_servers = json.dumps(fav_servers)
-            self.session.commit()
+            with self._session("set_fav_servers") as session:
+                user = session.query(User).filter_by(id=user_id).one()
+                # меняем только отличающиеся записи
+                rows = {row.name: row for row in session.query(FavServer).filter(FavServer.user_id == user_id)}
+                for name, row in rows.items():
+                    if name not in fav_servers:
+                        session.delete(row)
+                    elif row.address != fav_servers[name]:
+                        row.address = fav_servers[name]
+                for name, address in fav_servers.items():
+                    if name not in rows:
+                        session.add(FavServer(user_id=user_id, name=name, address=address))
+                session.commit()
+                res = self._load_fav_servers(session, user_id)
+            self._cache_user(user, res)
 
         except NoResultFound:
             print(f"Пользователь с id={user_id} не найден")
+
+    def get_top_fav_addresses(self, limit: int = 10) -> list[tuple[str, int]]:
+        """Самые популярные избранные сервера: [(адрес, количество пользователей), ...]"""
+        with self._session("get_top_fav_addresses") as session:
+            count = func.count(FavServer.id)
+            rows = (session.query(FavServer.address, count)
+                    .group_by(FavServer.address)
+                    .order_by(count.desc())
+                    .limit(limit))
+            return [(address, n) for address, n in rows]
+
+    def get_fav_addresses(self) -> list[str]:
+        """Все адреса, добавленные в избранное хотя бы одним пользователем"""
+        with self._session("get_fav_addresses") as session:
+            return [address for (address,) in session.query(FavServer.address).distinct()]
+
+    def close(self):
+        """Записывает накопленные счётчики и закрывает все соединения пула"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flush_wakeup.set()
+        self._flusher.join()
+        self.flush_requests()
+        self.flush_history()
+        self.Session.remove()
+        self.engine.dispose()
+
+
+class AsyncMySession:
+    """
+    Асинхронная обёртка над MySession.
+
+    Запросы к базе выполняются в отдельном пуле потоков и не блокируют event loop.
+    """
+
+    def __init__(self, session: MySession = None, max_workers: int = 8):
+        self.sync = session or MySession()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def add_user(self, user):
+        return await self._call(self.sync.add_user, user)
+
+    async def add_request(self, user_id: int):
+        # счётчик только увеличивается в памяти, поток базы не нужен
+        self.sync.add_request(user_id)
+
+    async def get_fav_servers(self, user_id: int) -> dict[str, str]:
+        return await self._call(self.sync.get_fav_servers, user_id)
+
+    async def set_fav_servers(self, user_id: int, fav_servers):
+        return await self._call(self.sync.set_fav_servers, user_id, fav_servers)
+
+    async def get_top_fav_addresses(self, limit: int = 10) -> list[tuple[str, int]]:
+        return await self._call(self.sync.get_top_fav_addresses, limit)
+
+    async def get_fav_addresses(self) -> list[str]:
+        return await self._call(self.sync.get_fav_addresses)
+
+    async def get_server_history(self, address: str, since: float) -> list[tuple]:
+        return await self._call(self.sync.get_server_history, address, since)
+
+    async def close(self):
+        await self._call(self.sync.close)
+        self._executor.shutdown()
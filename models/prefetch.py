@@ -0,0 +1,184 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from models.ratelimit import TokenBucket
+
+
+class RequestFrequency:
+    """
+    Частота запросов по адресам с экспоненциальным затуханием.
+
+    Значение счётчика - примерное количество запросов за последние
+    half_life секунд (старые запросы постепенно "забываются").
+    """
+
+    def __init__(self, half_life: float = 600.0, max_size: int = 10000):
+        self.half_life = half_life
+        self.max_size = max_size
+        self._counts: Dict[str, Tuple[float, float]] = {}  # адрес -> (счётчик, время обновления)
+        self._lock = threading.Lock()
+
+    def _decayed(self, count: float, updated: float, now: float) -> float:
+        return count * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, address: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            count, updated = self._counts.get(address, (0.0, now))
+            self._counts[address] = (self._decayed(count, updated, now) + 1, now)
+            if len(self._counts) > 2 * self.max_size:
+                self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        ranked = sorted(self._counts.items(), key=lambda kv: self._decayed(*kv[1], now), reverse=True)
+        self._counts = dict(ranked[:self.max_size])
+
+    def top(self, limit: int) -> List[Tuple[str, float]]:
+        """Самые запрашиваемые адреса: [(адрес, частота), ...]"""
+        now = time.monotonic()
+        with self._lock:
+            scored = [(address, self._decayed(count, updated, now))
+                      for address, (count, updated) in self._counts.items()]
+        return heapq.nlargest(limit, scored, key=lambda item: item[1])
+
+
+class PrefetchScheduler:
+    """
+    Фоновое обновление популярных серверов.
+
+    Популярность адреса складывается из числа пользователей, добавивших его
+    в избранное (fav_source), и частоты запросов (frequency). Чем популярнее
+    сервер, тем чаще он обновляется (от min_interval до max_interval);
+    сервера, которые не отвечают, обновляются реже. Общее число запросов
+    ограничено budget_per_minute.
+    """
+
+    def __init__(self, refresh: Callable[[str], Optional[dict]], frequency: RequestFrequency,
+                 fav_source: Optional[Callable[[int], Iterable[Tuple[str, int]]]] = None,
+                 budget_per_minute: float = 60, min_interval: float = 50, max_interval: float = 600,
+                 max_servers: int = 100, fav_weight: float = 2.0, rescan_interval: float = 60,
+                 workers: int = 4):
+        self.refresh = refresh
+        self.frequency = frequency
+        self.fav_source = fav_source
+        self.budget = TokenBucket(rate=budget_per_minute / 60, capacity=max(1.0, budget_per_minute / 6))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_servers = max_servers
+        self.fav_weight = fav_weight
+        self.rescan_interval = rescan_interval
+        self.refreshed = 0  # сколько обновлений выполнено
+
+        self._scores: Dict[str, float] = {}
+        self._due: Dict[str, float] = {}  # адрес -> время следующего обновления
+        self._failures: Dict[str, int] = {}
+        self._in_progress: set = set()
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._thread = threading.Thread(target=self._loop, name="prefetch", daemon=True)
+
+    def start(self) -> "PrefetchScheduler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def queue_size(self) -> int:
+        with self._lock:
+            return len(self._due)
+
+    def interval(self, address: str) -> float:
+        """Интервал обновления адреса с учётом популярности и ошибок"""
+        score = self._scores.get(address, 0.0)
+        interval = self.max_interval / (1 + score)
+        interval *= 2 ** min(self._failures.get(address, 0), 4)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def rescan(self) -> None:
+        """Пересчитывает список популярных адресов"""
+        scores: Dict[str, float] = {}
+        if self.fav_source is not None:
+            try:
+                for address, count in self.fav_source(self.max_servers):
+                    scores[address] = scores.get(address, 0.0) + count * self.fav_weight
+            except Exception as ex:
+                print(f"Не удалось получить избранные сервера для обновления: {ex}")
+        for address, frequency in self.frequency.top(self.max_servers):
+            scores[address] = scores.get(address, 0.0) + frequency
+        hot = dict(heapq.nlargest(self.max_servers, scores.items(), key=lambda item: item[1]))
+
+        now = time.monotonic()
+        with self._lock:
+            self._scores = hot
+            self._due = {address: self._due.get(address, now) for address in hot}
+            self._failures = {a: n for a, n in self._failures.items() if a in hot}
+            self._heap = [(due, address) for address, due in self._due.items()]
+            heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def _next(self) -> Tuple[Optional[str], float]:
+        """Следующий адрес для обновления или (None, сколько ждать)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._heap:
+                due, address = self._heap[0]
+                if self._due.get(address) != due or address in self._in_progress:
+                    heapq.heappop(self._heap)  # запись устарела
+                    continue
+                if due > now:
+                    return None, due - now
+                heapq.heappop(self._heap)
+                self._in_progress.add(address)
+                return address, 0.0
+        return None, self.rescan_interval
+
+    def _loop(self) -> None:
+        next_rescan = 0.0
+        while not self._stopped.is_set():
+            if time.monotonic() >= next_rescan:
+                self.rescan()
+                next_rescan = time.monotonic() + self.rescan_interval
+
+            wait_budget = self.budget.wait_time()
+            if wait_budget > 0:
+                self._stopped.wait(wait_budget)
+                continue
+
+            self._wakeup.clear()
+            address, delay = self._next()
+            if address is None:
+                self._wakeup.wait(min(delay, max(0.0, next_rescan - time.monotonic())))
+                continue
+
+            self.budget.take()
+            self._executor.submit(self._refresh, address)
+
+    def _refresh(self, address: str) -> None:
+        ok = False
+        try:
+            data = self.refresh(address)
+            ok = bool(data and data.get("ping") and data.get("is_online"))
+        except Exception:
+            pass
+        self.refreshed += 1
+
+        with self._lock:
+            self._in_progress.discard(address)
+            if address not in self._scores:
+                return  # адрес больше не популярен
+            self._failures[address] = 0 if ok else self._failures.get(address, 0) + 1
+            due = time.monotonic() + self.interval(address)
+            self._due[address] = due
+            heapq.heappush(self._heap, (due, address))
+        self._wakeup.set()
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Iterable, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Ведро токенов: не больше capacity запросов подряд и в среднем
+    rate запросов в секунду.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, tokens: float = 1) -> bool:
+        """Забирает токены, если их достаточно"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Через сколько секунд станет доступно нужное количество токенов"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._wait_time(tokens)
+
+    def _wait_time(self, tokens: float) -> float:
+        if self.tokens >= tokens or self.rate <= 0:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+
+class KeyedRateLimiter:
+    """
+    Отдельное ведро токенов для каждого ключа (id пользователя, чата, ...).
+
+    Ведра, которые давно не использовались (и успели наполниться), удаляются,
+    когда их становится больше max_keys. rate <= 0 отключает ограничение.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 100000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[object, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _bucket(self, key) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+                if len(self._buckets) > self.max_keys:
+                    self._evict()
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def _evict(self) -> None:
+        # ведро, которое не трогали capacity / rate секунд, уже полное - его можно пересоздать
+        idle = time.monotonic() - self.capacity / self.rate
+        while len(self._buckets) > self.max_keys:
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket.updated > idle:
+                break
+            del self._buckets[key]
+
+    def take(self, key, tokens: float = 1) -> bool:
+        if not self.enabled:
+            return True
+        return self._bucket(key).take(min(tokens, self.capacity))
+
+    def wait_time(self, key, tokens: float = 1) -> float:
+        if not self.enabled:
+            return 0.0
+        return self._bucket(key).wait_time(min(tokens, self.capacity))
+
+    def take_with(self, key, tokens: float = 1,
+                  others: Iterable[Tuple["KeyedRateLimiter", object]] = ()) -> Tuple[float, ...]:
+        """
+        Атомарно забирает токены из ведра key и из вёдер others ((ограничитель, ключ), ...):
+        из всех сразу или ни из одного. Возвращает время ожидания для каждого ведра
+        в том же порядке; если все значения 0, токены списаны.
+        """
+        limiters = [(self, key)] + list(others)
+        buckets = [(limiter._bucket(k), min(tokens, limiter.capacity)) if limiter.enabled else (None, 0)
+                   for limiter, k in limiters]
+        # блокировки берутся в одном порядке, чтобы параллельные вызовы не ждали друг друга по кругу
+        locked = sorted({id(bucket): bucket for bucket, _ in buckets if bucket is not None}.values(), key=id)
+        for bucket in locked:
+            bucket._lock.acquire()
+        try:
+            now = time.monotonic()
+            for bucket in locked:
+                bucket._refill(now)
+            waits = tuple(bucket._wait_time(n) if bucket is not None else 0.0 for bucket, n in buckets)
+            if not any(waits):
+                for bucket, n in buckets:
+                    if bucket is not None:
+                        bucket.tokens -= n
+            return waits
+        finally:
+            for bucket in reversed(locked):
+                bucket._lock.release()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class FairSemaphore:
+    """
+    Семафор с очередью в порядке прихода: ограничивает число одновременных
+    операций, остальные ждут своей очереди не дольше timeout.
+    limit <= 0 отключает ограничение.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: "deque[threading.Event]" = deque()
+        self._lock = threading.Lock()
+
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        if self.limit <= 0:
+            return True
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+
+        if waiter.wait(timeout):
+            return True  # место передано из release()
+        with self._lock:
+            if waiter.is_set():
+                return True  # место передали, пока истекал таймаут
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self) -> None:
+        if self.limit <= 0:
+            return
+        with self._lock:
+            if self._waiters:
+                # место сразу переходит первому в очереди, active не меняется
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+
+    def __enter__(self) -> "FairSemaphore":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -0,0 +1,311 @@
+"""
+Клиент протокола Minecraft Java Server List Ping.
+
+Опрашивает сервер напрямую по TCP (handshake -> status request -> ping),
+без обращения к стороннему API. SRV-записи DNS не разрешаются,
+поэтому для таких серверов нужно указывать порт явно.
+"""
+import asyncio
+import json
+import re
+import socket
+import struct
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from models.errors import GetServerInfoError, ServerTimeoutError
+
+DEFAULT_PORT = 25565
+# -1 означает, что клиент не привязан к конкретной версии протокола
+PROTOCOL_VERSION = -1
+# ограничение размера пакета, чтобы не читать бесконечный поток
+MAX_PACKET_SIZE = 2 ** 21
+
+_FORMAT_CODES = re.compile("§.")
+
+
+def pack_varint(value: int) -> bytes:
+    """Кодирует число в VarInt (отрицательные - как 32-битные без знака)"""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def read_varint(read: Callable[[int], bytes]) -> int:
+    """Читает VarInt, используя функцию read(n) -> bytes"""
+    result = 0
+    for i in range(5):
+        byte = read(1)[0]
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            if result & 0x80000000:
+                result -= 1 << 32
+            return result
+    raise ValueError("Слишком длинный VarInt")
+
+
+def pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return pack_varint(len(data)) + data
+
+
+def pack_packet(packet_id: int, payload: bytes = b"") -> bytes:
+    """Оборачивает данные в пакет: длина, id пакета, данные"""
+    body = pack_varint(packet_id) + payload
+    return pack_varint(len(body)) + body
+
+
+def build_handshake(host: str, port: int) -> bytes:
+    payload = (pack_varint(PROTOCOL_VERSION) + pack_string(host) +
+               struct.pack(">H", port) + pack_varint(1))  # 1 - переход в состояние status
+    return pack_packet(0x00, payload)
+
+
+def build_status_request() -> bytes:
+    return pack_packet(0x00)
+
+
+def build_ping(token: int) -> bytes:
+    return pack_packet(0x01, struct.pack(">q", token))
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Разбирает адрес вида host, host:port или [ipv6]:port"""
+    address = address.strip()
+    if address.startswith("["):
+        host, _, rest = address[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else ""
+    elif address.count(":") == 1:
+        host, port = address.split(":")
+    else:
+        host, port = address, ""
+    if not host:
+        raise GetServerInfoError(f'Некорректный адрес сервера "{address}"')
+    try:
+        port = int(port) if port else DEFAULT_PORT
+    except ValueError:
+        raise GetServerInfoError(f'Некорректный порт в адресе "{address}"')
+    if not 0 < port < 65536:
+        raise GetServerInfoError(f'Некорректный порт в адресе "{address}"')
+    return host, port
+
+
+def _flatten_chat(component: Any) -> str:
+    """Собирает текст из JSON-компонента чата (description)"""
+    if isinstance(component, str):
+        return component
+    if isinstance(component, list):
+        return "".join(_flatten_chat(c) for c in component)
+    if isinstance(component, dict):
+        return str(component.get("text", "")) + "".join(_flatten_chat(c) for c in component.get("extra", []))
+    return ""
+
+
+def clean_motd(description: Any) -> List[str]:
+    """Возвращает описание сервера построчно, без кодов форматирования"""
+    text = _FORMAT_CODES.sub("", _flatten_chat(description))
+    lines = [line.strip() for line in text.split("\n")]
+    return [line for line in lines if line] or ["Нет описания"]
+
+
+def parse_status(status: Dict[str, Any], ip: str, port: int, latency: float) -> Dict[str, Any]:
+    """Преобразует ответ сервера в словарь того же вида, что и get_mc_server_info"""
+    players = status.get("players") or {}
+    version = status.get("version") or {}
+    return {
+        "ping": True,
+        "motd": clean_motd(status.get("description", "")),
+        "version": _FORMAT_CODES.sub("", str(version.get("name", "Неизвестно"))),
+        "players": players.get("online", 0),
+        "max_players": players.get("max", 0),
+        "is_online": True,
+        "address": f"{ip}:{port}",
+        "players_list": [{"name": p.get("name", ""), "uuid": p.get("id", "")}
+                         for p in players.get("sample") or []],
+        "latency": round(latency * 1000),
+    }
+
+
+def _parse_status_or_fail(status: Any, ip: str, port: int, latency: float) -> Dict[str, Any]:
+    # JSON может оказаться чем угодно (не объект, players - строка, ...)
+    try:
+        return parse_status(status, ip, port, latency)
+    except (AttributeError, TypeError, ValueError) as exc:
+        raise GetServerInfoError("Некорректный ответ сервера") from exc
+
+
+def offline_result(host: str, port: int) -> Dict[str, Any]:
+    """Результат для сервера, который не принимает подключения"""
+    return {
+        "ping": False,
+        "motd": ["Нет описания"],
+        "version": "Неизвестно",
+        "players": 0,
+        "max_players": 0,
+        "is_online": False,
+        "address": f"{host}:{port}",
+        "players_list": [],
+    }
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ValueError("Сервер закрыл соединение")
+        buf += chunk
+    return bytes(buf)
+
+
+def _read_packet(sock: socket.socket) -> Tuple[int, bytes]:
+    length = read_varint(lambda n: _recv_exact(sock, n))
+    if not 0 < length <= MAX_PACKET_SIZE:
+        raise ValueError("Некорректная длина пакета")
+    return _split_packet(_recv_exact(sock, length))
+
+
+async def _async_read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    length = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            break
+    else:
+        raise ValueError("Слишком длинный VarInt")
+    if not 0 < length <= MAX_PACKET_SIZE:
+        raise ValueError("Некорректная длина пакета")
+    return _split_packet(await reader.readexactly(length))
+
+
+def _split_packet(body: bytes) -> Tuple[int, bytes]:
+    """Отделяет id пакета от его данных"""
+    pos = 0
+
+    def read(n: int) -> bytes:
+        nonlocal pos
+        pos += n
+        return body[pos - n:pos]
+
+    packet_id = read_varint(read)
+    return packet_id, body[pos:]
+
+
+def decode_status_packet(packet_id: int, payload: bytes) -> Dict[str, Any]:
+    """Разбирает пакет status response (JSON-строка с данными сервера)"""
+    if packet_id != 0x00:
+        raise ValueError("Неожиданный пакет от сервера")
+    pos = 0
+
+    def read(n: int) -> bytes:
+        nonlocal pos
+        pos += n
+        return payload[pos - n:pos]
+
+    size = read_varint(read)
+    return json.loads(payload[pos:pos + size].decode("utf-8"))
+
+
+def get_slp_server_info(address: str, timeout: float = 5.0) -> Dict[str, Any]:
+    """
+    Получает информацию о Minecraft-сервере по протоколу Server List Ping.
+
+    Args:
+        address (str): IP или домен сервера (с портом, если не стандартный).
+        timeout (float): таймаут подключения и чтения в секундах.
+
+    Returns:
+        Dict[str, Any]: Словарь с данными сервера (дополнительно latency в мс).
+
+    Raises:
+        ConnectionError: обрыв соединения
+        GetServerInfoError: таймаут, некорректный адрес или некорректный ответ сервера
+    """
+    host, port = parse_address(address)
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    except socket.timeout:
+        raise ServerTimeoutError(f'Превышено время ожидания ответа от сервера "{address}"')
+    except OSError:
+        # сервер не найден или не принимает подключения
+        return offline_result(host, port)
+
+    with sock:
+        try:
+            ip = sock.getpeername()[0]
+            started = time.perf_counter()
+            sock.sendall(build_handshake(host, port) + build_status_request())
+            status = decode_status_packet(*_read_packet(sock))
+            latency = time.perf_counter() - started
+        except socket.timeout:
+            raise ServerTimeoutError(f'Превышено время ожидания ответа от сервера "{address}"')
+        except OSError as exc:
+            raise ConnectionError(f"Ошибка подключения: {exc}") from exc
+        except (ValueError, IndexError) as exc:
+            raise GetServerInfoError("Некорректный ответ сервера") from exc
+
+        try:
+            # задержку точнее измеряет ping/pong, но его поддерживают не все сервера
+            token = int(time.time() * 1000)
+            started = time.perf_counter()
+            sock.sendall(build_ping(token))
+            packet_id, payload = _read_packet(sock)
+            if packet_id == 0x01 and struct.unpack(">q", payload[:8])[0] == token:
+                latency = time.perf_counter() - started
+        except (OSError, ValueError, IndexError, struct.error):
+            pass
+
+    return _parse_status_or_fail(status, ip, port, latency)
+
+
+async def async_get_slp_server_info(address: str, timeout: float = 5.0) -> Dict[str, Any]:
+    """Асинхронная версия get_slp_server_info"""
+    host, port = parse_address(address)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        raise ServerTimeoutError(f'Превышено время ожидания ответа от сервера "{address}"')
+    except OSError:
+        # сервер не найден или не принимает подключения
+        return offline_result(host, port)
+
+    try:
+        try:
+            ip = writer.get_extra_info("peername")[0]
+            started = time.perf_counter()
+            writer.write(build_handshake(host, port) + build_status_request())
+            await writer.drain()
+            status = decode_status_packet(*await asyncio.wait_for(_async_read_packet(reader), timeout))
+            latency = time.perf_counter() - started
+        except asyncio.TimeoutError:
+            raise ServerTimeoutError(f'Превышено время ожидания ответа от сервера "{address}"')
+        except asyncio.IncompleteReadError as exc:
+            raise GetServerInfoError("Некорректный ответ сервера") from exc
+        except OSError as exc:
+            raise ConnectionError(f"Ошибка подключения: {exc}") from exc
+        except (ValueError, IndexError) as exc:
+            raise GetServerInfoError("Некорректный ответ сервера") from exc
+
+        try:
+            # задержку точнее измеряет ping/pong, но его поддерживают не все сервера
+            token = int(time.time() * 1000)
+            started = time.perf_counter()
+            writer.write(build_ping(token))
+            await writer.drain()
+            packet_id, payload = await asyncio.wait_for(_async_read_packet(reader), timeout)
+            if packet_id == 0x01 and struct.unpack(">q", payload[:8])[0] == token:
+                latency = time.perf_counter() - started
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError, ValueError, IndexError, struct.error):
+            pass
+    finally:
+        writer.close()
+
+    return _parse_status_or_fail(status, ip, port, latency)
@@ -0,0 +1,104 @@
+import hmac
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional
+
+from flask import Flask, Response, jsonify, request
+
+from models.metrics import CONTENT_TYPE, REGISTRY
+
+logger = logging.getLogger('my_app')
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Приём апдейтов Telegram через webhook.
+
+    Flask-приложение (app) проверяет секретный токен (без него сервер
+    не создаётся, чтобы не принимать апдейты от кого угодно) и кладёт апдейт
+    в ограниченную очередь, которую разбирают рабочие потоки. Если очередь
+    заполнена, возвращается 503 и Telegram повторит доставку позже.
+    /health сообщает состояние очереди (503, если она заполнена),
+    /metrics отдаёт метрики в формате Prometheus.
+    """
+
+    def __init__(self, handle_update: Callable[[dict], None], secret_token: str,
+                 path: str = "/webhook", queue_size: int = 1000, workers: int = 8):
+        if not secret_token:
+            raise ValueError("secret_token is required")
+        self.handle_update = handle_update
+        self.secret_token = secret_token
+        self.queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.processed = 0
+        self.rejected = 0
+        self._threads: List[threading.Thread] = []
+
+        self.app = Flask(__name__)
+        self.app.add_url_rule(path, "webhook", self._webhook, methods=["POST"])
+        self.app.add_url_rule("/health", "health", self._health, methods=["GET"])
+        self.app.add_url_rule("/metrics", "metrics", self._metrics, methods=["GET"])
+
+    def _webhook(self):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return "", 403
+
+        update = request.get_json(silent=True)
+        if not isinstance(update, dict):
+            return "", 400
+
+        try:
+            self.queue.put_nowait(update)
+        except queue.Full:
+            self.rejected += 1
+            return "", 503, {"Retry-After": "1"}
+        return "", 200
+
+    def _health(self):
+        full = self.queue.full()
+        return jsonify(
+            status="overloaded" if full else "ok",
+            queue=self.queue.qsize(),
+            queue_size=self.queue.maxsize,
+            workers=sum(thread.is_alive() for thread in self._threads),
+            processed=self.processed,
+            rejected=self.rejected,
+        ), 503 if full else 200
+
+    def _metrics(self):
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    def _worker(self):
+        while True:
+            update = self.queue.get()
+            try:
+                if update is None:
+                    return
+                self.handle_update(update)
+                self.processed += 1
+            except Exception as ex:
+                logger.error(f"Error while processing update: {ex}")
+            finally:
+                self.queue.task_done()
+
+    def start_workers(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"webhook-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Дожидается обработки очереди и останавливает рабочие потоки"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def run(self, host: str = "0.0.0.0", port: int = 8080) -> None:
+        """Запускает встроенный сервер Flask (для продакшена лучше WSGI-сервер)"""
+        self.start_workers()
+        self.app.run(host=host, port=port, threaded=True)
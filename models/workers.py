@@ -0,0 +1,222 @@
+"""
+Многопроцессный режим (BOT_MODE=workers).
+
+Один процесс получает апдейты и раскладывает их по очередям рабочих
+процессов по id пользователя: все апдейты пользователя попадают в один
+процесс и в один его поток, поэтому обрабатываются по порядку, а кэш
+пользователей и ограничение частоты запросов пользователя остаются
+согласованными. Ограничения, общие для нескольких пользователей (групповой
+чат, одновременные запросы к серверам), у каждого процесса свои.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger('my_app')
+
+# типы апдейтов, в которых пользователь указан в поле from
+USER_UPDATE_TYPES = ("message", "edited_message", "inline_query", "chosen_inline_result", "callback_query",
+                     "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+                     "chat_join_request", "message_reaction", "business_message")
+
+
+def update_user_id(update: dict) -> int:
+    """id пользователя (или чата, если пользователя нет) из апдейта в формате Bot API; 0, если не найден"""
+    for kind in USER_UPDATE_TYPES:
+        body = update.get(kind)
+        if not isinstance(body, dict):
+            continue
+        user = body.get("from") or body.get("user")
+        if user:
+            return int(user["id"])
+        chat = body.get("chat")
+        if chat:
+            return int(chat["id"])
+    return 0
+
+
+def partition(user_id: int, count: int) -> int:
+    return user_id % count if count > 1 else 0
+
+
+class WorkerPool:
+    """
+    Рабочие процессы с отдельной ограниченной очередью у каждого.
+
+    target(index, updates) запускается в новом процессе (spawn: модуль
+    с target импортируется заново и сам настраивает логи, базу и кэши).
+    submit() блокируется, если очередь процесса заполнена, - так приём
+    апдейтов замедляется вместе с обработкой.
+
+    Перед каждой отправкой (и раз в put_timeout секунд, пока очередь заполнена)
+    проверяется, жив ли процесс. Упавший процесс перезапускается с новой
+    очередью (апдейты из старой теряются). Если он падает вскоре после запуска,
+    перезапуск откладывается: restart_delay, затем вдвое дольше, но не больше
+    max_restart_delay секунд. Пока процесс не работает, апдейты его
+    пользователей отбрасываются, чтобы остальные пользователи не ждали.
+    """
+
+    def __init__(self, target: Callable[[int, "multiprocessing.Queue"], None], processes: int,
+                 queue_size: int = 1000, restart_delay: float = 5.0, max_restart_delay: float = 60.0,
+                 put_timeout: float = 1.0):
+        self.target = target
+        self.size = max(1, processes)
+        self.queue_size = queue_size
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.put_timeout = put_timeout
+        self.submitted = 0
+        self.dropped = 0
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(maxsize=queue_size) for _ in range(self.size)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * self.size
+        self._started_at = [0.0] * self.size
+        self._failures = [0] * self.size  # падения подряд вскоре после запуска
+        self._restart_at: List[Optional[float]] = [None] * self.size
+
+    def _start_process(self, index: int) -> None:
+        # номер процесса передаётся и в переменной окружения WORKER_ID: она доступна
+        # уже при импорте модуля, например для выбора файлов логов
+        previous = os.environ.get("WORKER_ID")
+        os.environ["WORKER_ID"] = str(index)
+        try:
+            process = self._context.Process(target=self.target, args=(index, self.queues[index]),
+                                            name=f"worker-{index}")
+            process.start()
+        finally:
+            if previous is None:
+                os.environ.pop("WORKER_ID", None)
+            else:
+                os.environ["WORKER_ID"] = previous
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def start(self) -> "WorkerPool":
+        for index in range(self.size):
+            self._start_process(index)
+        return self
+
+    def _ensure_alive(self, index: int) -> bool:
+        """Перезапускает упавший процесс; False, если он не работает и перезапускать ещё рано"""
+        process = self.processes[index]
+        if process is not None and process.is_alive():
+            return True
+        now = time.monotonic()
+        if self._restart_at[index] is None:
+            # падение только что обнаружено: откладываем перезапуск, если процесс падает сразу после запуска
+            if now - self._started_at[index] < self.max_restart_delay:
+                self._failures[index] += 1
+            else:
+                self._failures[index] = 0
+            delay = 0.0
+            if self._failures[index]:
+                delay = min(self.max_restart_delay, self.restart_delay * 2 ** (self._failures[index] - 1))
+            self._restart_at[index] = now + delay
+            if delay:
+                logger.error(f"worker-{index} exited with code {process.exitcode if process else None}, "
+                             f"restarting in {delay:g} s")
+        if now < self._restart_at[index]:
+            return False
+        self._restart_at[index] = None
+
+        old = self.queues[index]
+        try:
+            lost = old.qsize()
+        except NotImplementedError:  # macOS
+            lost = "?"
+        logger.error(f"worker-{index} exited with code {process.exitcode if process else None}, "
+                     f"restarting ({lost} queued updates lost)")
+        # процесс мог упасть, удерживая блокировку очереди, поэтому очередь создаётся заново
+        old.cancel_join_thread()
+        old.close()
+        self.queues[index] = self._context.Queue(maxsize=self.queue_size)
+        self._start_process(index)
+        self.restarts += 1
+        return True
+
+    def submit(self, update: dict) -> bool:
+        """Отправляет апдейт процессу его пользователя; False, если апдейт отброшен"""
+        index = partition(update_user_id(update), self.size)
+        while self._ensure_alive(index):
+            try:
+                self.queues[index].put(update, timeout=self.put_timeout)
+            except queue.Full:
+                continue  # очередь занята живым процессом - ждём, заодно снова проверяем, жив ли он
+            self.submitted += 1
+            return True
+        self.dropped += 1
+        logger.warning(f"worker-{index} is down, update {update.get('update_id')} dropped")
+        return False
+
+    def queue_sizes(self) -> dict:
+        sizes = {}
+        for index, updates in enumerate(self.queues):
+            try:
+                sizes[f"worker-{index}"] = updates.qsize()
+            except NotImplementedError:  # macOS
+                pass
+        return sizes
+
+    def alive(self) -> int:
+        return sum(process is not None and process.is_alive() for process in self.processes)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Дожидается обработки очередей и останавливает процессы"""
+        for process, updates in zip(self.processes, self.queues):
+            if process is not None and process.is_alive():
+                updates.put(None)
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop in {timeout:g} s, terminating")
+                process.terminate()
+                process.join()
+        self.processes = [None] * self.size
+
+
+def serve_partition(updates: "multiprocessing.Queue", handle_update: Callable[[dict], None], threads: int,
+                    processes: int, queue_size: int = 100) -> None:
+    """
+    Обрабатывает очередь рабочего процесса до получения None.
+
+    Апдейты распределяются по потокам процесса тоже по id пользователя,
+    поэтому апдейты одного пользователя по-прежнему обрабатываются по порядку.
+    Очереди потоков ограничены queue_size, чтобы при перегрузке апдейты
+    копились в очереди процесса и WorkerPool.submit() замедлял приём.
+    """
+    threads = max(1, threads)
+    local_queues: List["queue.Queue[Optional[dict]]"] = [queue.Queue(maxsize=queue_size) for _ in range(threads)]
+
+    def worker(local: "queue.Queue[Optional[dict]]"):
+        while True:
+            update = local.get()
+            if update is None:
+                return
+            try:
+                handle_update(update)
+            except Exception as ex:
+                logger.error(f"Error while processing update: {ex}")
+
+    pool = [threading.Thread(target=worker, args=(local,), name=f"update-{i}", daemon=True)
+            for i, local in enumerate(local_queues)]
+    for thread in pool:
+        thread.start()
+
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+        # в этот процесс попадают пользователи с одинаковым остатком от деления на processes
+        local_queues[partition(update_user_id(update) // max(1, processes), threads)].put(update)
+
+    for local in local_queues:
+        local.put(None)
+    for thread in pool:
+        thread.join()